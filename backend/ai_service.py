@@ -1,8 +1,15 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from groq import Groq
+from explanation_cache import explanation_cache
+import abc
+import asyncio
 import ast
+import hashlib
+import random
+from contextlib import aclosing, asynccontextmanager
+import httpx
+import groq
 
 # Load Environment Variables
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -10,12 +17,252 @@ ENV_PATH = BASE_DIR / ".env"
 load_dotenv(dotenv_path=ENV_PATH)
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+# Points the client at another OpenAI-compatible server, e.g. a local fake in tests.
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL")
+AI_MODEL = os.environ.get("AI_MODEL", "llama-3.3-70b-versatile")
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", 8))
+AI_MAX_CONNECTIONS = int(os.environ.get("AI_MAX_CONNECTIONS", 16))
+AI_CONNECT_TIMEOUT = float(os.environ.get("AI_CONNECT_TIMEOUT", 5))
+AI_TIMEOUT = float(os.environ.get("AI_TIMEOUT", 60))
+AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", 3))
+AI_RETRY_BASE_DELAY = float(os.environ.get("AI_RETRY_BASE_DELAY", 0.5))
+AI_RETRY_MAX_DELAY = float(os.environ.get("AI_RETRY_MAX_DELAY", 8))
 
-def generate_full_code_explanation(code: str, runtime_error: str = None) -> str:
+# --- NEW IMPROVED PROMPT ---
+SYSTEM_PROMPT = """
+        You are an expert Python Tutor. Explain the code in a friendly, structured way so beginners can understand it.
+
+        Output Requirements:
+        1. Use clear Markdown formatting.
+        2. Be concise, visual, and beginner-friendly.
+        3. DO NOT generate execution-flow tables, step-by-step runtime traces, or grouped iteration descriptions.
+
+        Response Structure:
+
+        💡 **1. Big Picture**
+        - One-sentence summary of what the code accomplishes.
+        - Provide a simple analogy or real-world comparison.
+
+        🔑 **2. Key Concepts Used**
+        - List 2–4 important concepts relevant to learning (e.g., recursion, loops, variables, return values)
+
+        🧠 **3. How It Works (Logic Explanation)**
+        - Explain the logic in a natural short explanation format.
+        - Avoid line-by-line or step-by-step execution.
+        - Focus on understanding rather than execution order.
+
+        ⏱️ **4. Time & Space Complexity**
+        - Provide estimated time complexity (e.g., O(n))
+        - Provide space complexity (e.g., O(1) or O(n))
+        - Short explanation why
+
+        📤 **5. Final Output**
+        - Show the final printed output if applicable.
+        """
+# Cached explanations from an older prompt are not served.
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+class RetryableError(Exception):
+    """A failure worth retrying: rate limiting, a 5xx response, a timeout or a dropped connection."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# --- Backends ---
+class ExplanationBackend(abc.ABC):
     """
-    Generates a structured student-friendly explanation or a clear descriptive error message.
+    Produces a chat completion. Implementations raise RetryableError for
+    transient failures and anything else for permanent ones.
     """
 
+    @abc.abstractmethod
+    async def complete(self, messages, model, temperature, max_tokens) -> str:
+        ...
+
+    async def stream(self, messages, model, temperature, max_tokens):
+        """Yields the completion in pieces as it is generated; by default all at once."""
+        yield await self.complete(messages, model, temperature, max_tokens)
+
+    async def close(self):
+        pass
+
+class GroqBackend(ExplanationBackend):
+    """Groq chat completions over one long-lived, pooled HTTP client."""
+
+    def __init__(self, api_key, base_url=None, max_connections=AI_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._client = None
+
+    def _get_client(self):
+        # Created on first use so the connection pool belongs to the serving event loop.
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(AI_TIMEOUT, connect=AI_CONNECT_TIMEOUT),
+            )
+            # Retries are done by ExplanationClient so they share its backoff and metrics.
+            self._client = groq.AsyncGroq(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=http_client)
+        return self._client
+
+    async def complete(self, messages, model, temperature, max_tokens):
+        try:
+            completion = await self._get_client().chat.completions.create(
+                messages=messages, model=model, temperature=temperature, max_tokens=max_tokens
+            )
+        except groq.APIError as e:
+            raise _transient(e) or e
+        return completion.choices[0].message.content
+
+    async def stream(self, messages, model, temperature, max_tokens):
+        try:
+            chunks = await self._get_client().chat.completions.create(
+                messages=messages, model=model, temperature=temperature, max_tokens=max_tokens, stream=True
+            )
+        except groq.APIError as e:
+            raise _transient(e) or e
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except groq.APIError as e:
+            raise _transient(e) or e
+        finally:
+            # Also runs when the consumer stops early, which aborts the upstream response.
+            await chunks.close()
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.close()
+
+def _transient(error):
+    """The RetryableError for a transient API error, or None."""
+    if isinstance(error, (groq.APIConnectionError, groq.APITimeoutError)):
+        return RetryableError(str(error))
+    if isinstance(error, groq.APIStatusError) and (error.status_code == 429 or error.status_code >= 500):
+        return RetryableError(str(error), _retry_after(error.response))
+    return None
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+# --- Client ---
+class ExplanationClient:
+    """
+    Runs completions on a backend with at most `max_concurrency` requests in
+    flight. Transient failures are retried up to `max_retries` times with
+    exponential backoff and full jitter (or the server's Retry-After, if longer).
+    """
+
+    def __init__(self, backend=None, max_concurrency=AI_MAX_CONCURRENCY, max_retries=AI_MAX_RETRIES,
+                 base_delay=AI_RETRY_BASE_DELAY, max_delay=AI_RETRY_MAX_DELAY):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self.completed = 0
+        self.retries = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def set_backend(self, backend):
+        """Swaps the backend (tests use this to talk to a fake); returns the old one."""
+        old, self.backend = self.backend, backend
+        return old
+
+    async def complete(self, messages, model=AI_MODEL, temperature=0.1, max_tokens=1500):
+        async with self._slot():
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await self.backend.complete(messages, model, temperature, max_tokens)
+                    self.completed += 1
+                    return result
+                except RetryableError as e:
+                    if attempt == self.max_retries:
+                        self.failed += 1
+                        raise
+                    await self._backoff(attempt, e)
+                except Exception:
+                    self.failed += 1
+                    raise
+
+    async def stream(self, messages, model=AI_MODEL, temperature=0.1, max_tokens=1500):
+        """
+        Like complete(), but yields the text as it arrives. A failure is only
+        retried before the first piece has been yielded.
+        """
+        async with self._slot():
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    async with aclosing(self.backend.stream(messages, model, temperature, max_tokens)) as pieces:
+                        async for piece in pieces:
+                            started = True
+                            yield piece
+                    self.completed += 1
+                    return
+                except RetryableError as e:
+                    if started or attempt == self.max_retries:
+                        self.failed += 1
+                        raise
+                    await self._backoff(attempt, e)
+                except Exception:
+                    self.failed += 1
+                    raise
+                except BaseException:
+                    # The consumer went away (client disconnect or cancellation).
+                    self.cancelled += 1
+                    raise
+
+    @asynccontextmanager
+    async def _slot(self):
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def _backoff(self, attempt, error):
+        self.retries += 1
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        await asyncio.sleep(max(delay, min(error.retry_after or 0, self.max_delay)))
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def metrics(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "completed": self.completed,
+            "retries": self.retries,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+explanation_client = ExplanationClient(GroqBackend(GROQ_API_KEY, GROQ_BASE_URL) if GROQ_API_KEY else None)
+
+
+def _check_code(code: str, runtime_error: str = None):
+    """The message to show instead of an explanation, or None if the code should go to the model."""
     # First: Detect syntax errors before calling LLM
     try:
         ast.parse(code)
@@ -44,55 +291,32 @@ def generate_full_code_explanation(code: str, runtime_error: str = None) -> str:
             f"💡 Fix error and try again."
         )
 
-    if not GROQ_API_KEY:
+    if explanation_client.backend is None:
         return "❌ **Server Configuration Error:** Missing GROQ_API_KEY"
+    return None
 
-    try:
-        client = Groq(api_key=GROQ_API_KEY)
-
-        # --- NEW IMPROVED PROMPT ---
-        system_prompt = """
-        You are an expert Python Tutor. Explain the code in a friendly, structured way so beginners can understand it.
-
-        Output Requirements:
-        1. Use clear Markdown formatting.
-        2. Be concise, visual, and beginner-friendly.
-        3. DO NOT generate execution-flow tables, step-by-step runtime traces, or grouped iteration descriptions.
-
-        Response Structure:
-
-        💡 **1. Big Picture**
-        - One-sentence summary of what the code accomplishes.
-        - Provide a simple analogy or real-world comparison.
-
-        🔑 **2. Key Concepts Used**
-        - List 2–4 important concepts relevant to learning (e.g., recursion, loops, variables, return values)
-
-        🧠 **3. How It Works (Logic Explanation)**
-        - Explain the logic in a natural short explanation format.
-        - Avoid line-by-line or step-by-step execution.
-        - Focus on understanding rather than execution order.
-
-        ⏱️ **4. Time & Space Complexity**
-        - Provide estimated time complexity (e.g., O(n))
-        - Provide space complexity (e.g., O(1) or O(n))
-        - Short explanation why
+def _messages(code: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Explain this Python code:\n\n```python\n{code}\n```"}
+    ]
 
-        📤 **5. Final Output**
-        - Show the final printed output if applicable.
-        """
+async def generate_full_code_explanation(code: str, runtime_error: str = None) -> str:
+    """
+    Generates a structured student-friendly explanation or a clear descriptive error message.
+    """
+    message = _check_code(code, runtime_error)
+    if message is not None:
+        return message
 
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Explain this Python code:\n\n```python\n{code}\n```"}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.1,
-            max_tokens=1500
-        )
+    cached = explanation_cache.get(code, AI_MODEL, PROMPT_VERSION)
+    if cached is not None:
+        return cached
 
-        return completion.choices[0].message.content
+    try:
+        explanation = await explanation_client.complete(_messages(code))
+        explanation_cache.put(code, explanation, AI_MODEL, PROMPT_VERSION)
+        return explanation
 
     except Exception as e:
         return (
@@ -102,4 +326,25 @@ def generate_full_code_explanation(code: str, runtime_error: str = None) -> str:
             f"Try again soon or contact support if it persists."
         )
 
+async def stream_full_code_explanation(code: str):
+    """
+    Yields the explanation in pieces while the model writes it. Error messages
+    and cached explanations come as one piece. A stream that runs to the end is
+    added to the cache; one abandoned by the client is not.
+    """
+    message = _check_code(code)
+    if message is not None:
+        yield message
+        return
+
+    cached = explanation_cache.get(code, AI_MODEL, PROMPT_VERSION)
+    if cached is not None:
+        yield cached
+        return
 
+    pieces = []
+    async with aclosing(explanation_client.stream(_messages(code))) as stream:
+        async for piece in stream:
+            pieces.append(piece)
+            yield piece
+    explanation_cache.put(code, "".join(pieces), AI_MODEL, PROMPT_VERSION)
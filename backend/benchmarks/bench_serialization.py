@@ -0,0 +1,84 @@
+"""
+Serialization time for trace and DP-visualizer responses: FastAPI's default
+path (jsonable_encoder + json.dumps) against json_encoding.encode_json, with
+and without orjson.
+
+    cd backend && python benchmarks/bench_serialization.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+import json_encoding
+from tracer_core import run_with_trace
+from routers.dp_visualizer import build_visualization
+
+PROGRAMS = {
+    "recursion": """
+def fact(n):
+    if n <= 1:
+        return 1
+    return n * fact(n - 1)
+
+data = [10, 35, 60, 45, 90, 20]
+largest = data[0]
+for value in data:
+    if value > largest:
+        largest = value
+print(fact(8), largest)
+""",
+    "loop-5k": """
+i = 0
+items = {"a": [1, 2, 3], "b": (4, 5)}
+while i < 2500:
+    i += 1
+""",
+}
+
+def fastapi_default(content):
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def stdlib_fallback(content):
+    orjson, json_encoding.orjson = json_encoding.orjson, None
+    try:
+        return json_encoding.encode_json(content)
+    finally:
+        json_encoding.orjson = orjson
+
+ENCODERS = {"jsonable_encoder+json": fastapi_default, "encode_json (stdlib)": stdlib_fallback}
+if json_encoding.orjson is not None:
+    ENCODERS["encode_json (orjson)"] = json_encoding.encode_json
+
+def best_of(fn, content, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def payloads():
+    for name, code in PROGRAMS.items():
+        yield f"trace {name}", run_with_trace(code)
+        yield f"trace {name} (delta)", run_with_trace(code, "delta")
+    yield "dp lcs", build_visualization("lcs", {"str1": "AGGTABQWERTY", "str2": "GXTXAYBQWRTY"})
+    yield "dp knapsack", build_visualization("knapsack", {"weights": [1, 3, 4, 5, 2, 6], "values": [1, 4, 5, 7, 3, 8], "capacity": 15})
+
+def main():
+    print(f"{'payload':<26}{'size':>10}" + "".join(f"{name:>24}" for name in ENCODERS))
+    for name, content in payloads():
+        size = len(fastapi_default(content))
+        row = f"{name:<26}{size / 1024:>8.0f}KB"
+        baseline = None
+        for encoder in ENCODERS.values():
+            seconds = best_of(encoder, content)
+            baseline = baseline or seconds
+            row += f"{seconds * 1000:>14.2f}ms ({baseline / seconds:>4.1f}x)"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS", 4))
+EXECUTOR_MAX_QUEUE = int(os.environ.get("EXECUTOR_MAX_QUEUE", 32))
+EXECUTOR_RETRY_AFTER = int(os.environ.get("EXECUTOR_RETRY_AFTER", 2))
+
+class ExecutorSaturated(Exception):
+    def __init__(self, name, retry_after=EXECUTOR_RETRY_AFTER):
+        super().__init__(f"The {name} executor is busy, try again in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking work called from async route handlers. At most
+    `workers` jobs run at once and at most `max_queue` more wait for a thread;
+    anything beyond that is rejected with ExecutorSaturated (a 503 response)
+    instead of piling up behind the event loop.
+    """
+
+    def __init__(self, name, workers=EXECUTOR_WORKERS, max_queue=EXECUTOR_MAX_QUEUE):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules `fn` and returns an asyncio future for its result. Raises
+        ExecutorSaturated immediately when the queue is full.
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name)
+            self._pending += 1
+            self._ensure_started()
+            executor = self._executor
+        # Counted off on the thread pool's own future: the asyncio wrapper is
+        # cancelled when a client disconnects, while the job keeps running.
+        future = executor.submit(functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(self._finished)
+        return asyncio.wrap_future(future)
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def metrics(self):
+        pending = self._pending
+        return {
+            "workers": self.workers,
+            "in_flight": min(pending, self.workers),
+            "queue_depth": max(0, pending - self.workers),
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+# Shared executor for CPU-bound endpoints (flowcharts, DP traces).
+cpu_executor = BoundedExecutor("cpu")
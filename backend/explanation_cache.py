@@ -0,0 +1,192 @@
+import ast
+import builtins
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.environ.get("EXPLANATION_CACHE_MAX_ENTRIES", 2048))
+EXPLANATION_CACHE_TTL = float(os.environ.get("EXPLANATION_CACHE_TTL", 7 * 24 * 3600))
+# Setting a directory keeps explanations across restarts (one SQLite file).
+EXPLANATION_CACHE_DIR = os.environ.get("EXPLANATION_CACHE_DIR")
+
+_BUILTIN_NAMES = set(dir(builtins))
+
+# --- Canonical Form ---
+# Two snippets share an explanation when their ASTs match after user-defined
+# identifiers are renamed in order of first appearance and docstrings are
+# dropped. Comments, whitespace and literal spelling (0x10 vs 16, quote style)
+# are already gone from the AST. Builtins, attributes, imported names, dunder
+# names (__init__, __str__) and keyword argument names are kept since they
+# change what the code does.
+class _IdentifierNormalizer(ast.NodeTransformer):
+    def __init__(self):
+        self.names = {}
+        self.imported = set()
+
+    def rename(self, name):
+        if name is None or name in _BUILTIN_NAMES or name in self.imported or _is_dunder(name):
+            return name
+        return self.names.setdefault(name, f"_{len(self.names)}")
+
+    def visit_Name(self, node):
+        node.id = self.rename(node.id)
+        return node
+
+    def visit_arg(self, node):
+        node.arg = self.rename(node.arg)
+        node.annotation = node.annotation and self.visit(node.annotation)
+        return node
+
+    def visit_FunctionDef(self, node):
+        node.name = self.rename(node.name)
+        _drop_docstring(node)
+        self.generic_visit(node)
+        return node
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_alias(self, node):
+        self.imported.add((node.asname or node.name).split(".")[0])
+        return node
+
+    def visit_Global(self, node):
+        node.names = [self.rename(name) for name in node.names]
+        return node
+
+    visit_Nonlocal = visit_Global
+
+    def visit_ExceptHandler(self, node):
+        node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+def _is_dunder(name):
+    return len(name) > 4 and name.startswith("__") and name.endswith("__")
+
+def _drop_docstring(node):
+    body = node.body
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+        node.body = body[1:] or [ast.Pass()]
+
+def canonicalize(code: str):
+    """
+    (key, names): a hash of the canonical form and the user identifiers in the
+    order they were numbered, or (None, None) if the code does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None, None
+    _drop_docstring(tree)
+    normalizer = _IdentifierNormalizer()
+    tree = normalizer.visit(tree)
+    return hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest(), list(normalizer.names)
+
+_CODE_SPAN = re.compile(r"```.*?```|`[^`\n]+`", re.DOTALL)
+
+def rename_identifiers(text: str, old_names, new_names) -> str:
+    """Rewrites identifiers inside the Markdown code spans of `text` for a renamed snippet."""
+    mapping = {old: new for old, new in zip(old_names, new_names) if old != new}
+    if not mapping:
+        return text
+    word = re.compile(r"\b(" + "|".join(re.escape(name) for name in sorted(mapping, key=len, reverse=True)) + r")\b")
+    return _CODE_SPAN.sub(lambda span: word.sub(lambda m: mapping[m.group(1)], span.group(0)), text)
+
+# --- Disk Tier ---
+class _DiskTier:
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "explanations.sqlite3"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS explanations (key TEXT PRIMARY KEY, entry TEXT, expires REAL)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM explanations WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, entry):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO explanations VALUES (?, ?, ?)", (key, json.dumps(entry), entry["expires"]))
+            self._conn.execute("DELETE FROM explanations WHERE expires <= ?", (time.time(),))
+            self._conn.commit()
+
+# --- Cache ---
+class ExplanationCache:
+    """
+    Explanations keyed by canonical code. Each entry records the model and
+    prompt version that produced it and is a miss once either changes or its
+    TTL passes. The in-memory tier is an LRU of `max_entries`; the SQLite tier
+    is optional.
+    """
+
+    def __init__(self, max_entries=EXPLANATION_CACHE_MAX_ENTRIES, ttl=EXPLANATION_CACHE_TTL, directory=EXPLANATION_CACHE_DIR):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(directory) if directory else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, code, model, prompt_version):
+        key, names = canonicalize(code)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self._disk is not None:
+            entry = self._disk.get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+        if entry is None or entry["expires"] <= time.time() or entry["model"] != model or entry["prompt_version"] != prompt_version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return rename_identifiers(entry["text"], entry["names"], names)
+
+    def put(self, code, text, model, prompt_version):
+        key, names = canonicalize(code)
+        if key is None:
+            return
+        entry = {"text": text, "names": names, "model": model, "prompt_version": prompt_version, "expires": time.time() + self.ttl}
+        self._remember(key, entry)
+        if self._disk is not None:
+            self._disk.put(key, entry)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_enabled": self._disk is not None,
+        }
+
+explanation_cache = ExplanationCache()
@@ -0,0 +1,53 @@
+import json
+import math
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder below produces the same JSON, only slower
+    orjson = None
+
+# --- Response Encoding ---
+# Trace and DP results are already plain dicts, lists and primitives, so they are
+# encoded directly instead of being walked by jsonable_encoder first. Anything
+# else (sets, pydantic models, ...) still goes through jsonable_encoder.
+#
+# orjson only handles 64-bit integers, so content holding a larger one (a
+# traced factorial, say) goes through the stdlib encoder instead. Both write
+# NaN and infinities as null.
+def _default(value):
+    return jsonable_encoder(value)
+
+def _finite(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+def _finite_default(value):
+    return _finite(_default(value))
+
+def encode_json(content) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(_finite(content), default=_finite_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def json_bytes_response(body: bytes, **kwargs) -> Response:
+    return Response(content=body, media_type="application/json", **kwargs)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with encode_json. Return it from a route (rather than
+    a dict) so FastAPI skips jsonable_encoder.
+    """
+
+    def render(self, content) -> bytes:
+        return encode_json(content)
@@ -1,4 +1,21 @@
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field
+
+class TraceScopeInput(BaseModel):
+    # Functions traced with everything they call, and inclusive line ranges.
+    functions: List[str] = []
+    lines: List[Tuple[int, int]] = []
 
 class CodeInput(BaseModel):
-    code: str
\ No newline at end of file
+    code: str
+    # "delta" returns the compact trace format described in tracer_core.py
+    trace_format: Literal["full", "delta"] = "full"
+    # Moves containers and objects into a shared, versioned heap table (see tracer_core.py)
+    heap: bool = False
+    # Trace only part of the program; "# trace:start" / "# trace:end" comments also work
+    scope: Optional[TraceScopeInput] = None
+    # Keep only the first and last `loop_keep` iterations of each loop; the rest become one summary step
+    loop_keep: Optional[int] = Field(None, ge=1)
+    # "execution" reports the values the program itself computed instead of evaluating each line first
+    # (see tracer_core.py); None uses the server's TRACE_CAPTURE
+    capture: Optional[Literal["eval", "execution"]] = None
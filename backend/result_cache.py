@@ -0,0 +1,157 @@
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# --- Configuration ---
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Setting a directory enables the on-disk tier (one SQLite file of zlib blobs).
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+# Bump whenever the shape of a cached response changes.
+RESULT_CACHE_VERSION = 4
+
+# Programs touching these can produce a different result on every run.
+NONDETERMINISTIC_MODULES = {"random", "time", "datetime", "uuid", "secrets", "os", "sys", "threading", "socket", "urllib", "requests"}
+NONDETERMINISTIC_CALLS = {"input", "open", "hash", "__import__", "exec", "eval"}
+
+# --- Request Normalization ---
+def normalize_code(code: str, keep_lines: bool = True) -> str:
+    """
+    Canonical form of a submission: the AST dump, so comments and formatting
+    do not change the key. Line numbers are kept by default because traces and
+    flowcharts refer to them.
+    """
+    try:
+        return ast.dump(ast.parse(code), include_attributes=keep_lines)
+    except SyntaxError:
+        return code
+
+def is_deterministic(code: str) -> bool:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(alias.name.split(".")[0] in NONDETERMINISTIC_MODULES for alias in node.names):
+                return False
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in NONDETERMINISTIC_MODULES:
+                return False
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in NONDETERMINISTIC_CALLS:
+            return False
+    return True
+
+def make_key(namespace: str, *parts) -> str:
+    payload = json.dumps([RESULT_CACHE_VERSION, namespace, parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- Disk Tier ---
+class _DiskTier:
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "results.sqlite3"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, body BLOB, size INTEGER, accessed REAL)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return zlib.decompress(row[0])
+
+    def put(self, key, body):
+        blob = zlib.compress(body)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute("SELECT key, size FROM results ORDER BY accessed LIMIT 1").fetchone()
+                if oldest is None:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+            self._conn.commit()
+
+# --- Cache ---
+class ResultCache:
+    """
+    Two-tier cache of encoded JSON responses: an in-memory LRU bounded by the
+    total size of its bodies, and an optional SQLite tier on disk.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, directory=RESULT_CACHE_DIR, disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(directory, disk_max_bytes) if directory else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return body
+        if self._disk is not None:
+            body = self._disk.get(key)
+            if body is not None:
+                self.disk_hits += 1
+                self._remember(key, body)
+                return body
+        self.misses += 1
+        return None
+
+    def put(self, key, body):
+        self._remember(key, body)
+        if self._disk is not None:
+            self._disk.put(key, body)
+
+    def _remember(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_enabled": self._disk is not None,
+        }
+
+result_cache = ResultCache()
@@ -1,8 +1,11 @@
 # backend/routers/ai_router.py
 
+from contextlib import aclosing
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from ai_service import generate_full_code_explanation
+from ai_service import generate_full_code_explanation, stream_full_code_explanation
+from json_encoding import encode_json
 
 router = APIRouter(prefix="/ai", tags=["AI Explanation"])
 
@@ -11,14 +14,37 @@ class FullExplanationRequest(BaseModel):
     code: str
 
 @router.post("/explain_full")
-def explain_full_code(request: FullExplanationRequest):
+async def explain_full_code(request: FullExplanationRequest):
     """
     Endpoint to get a holistic, structured explanation of the entire code
     to be displayed in the Explanation Panel.
     """
     try:
         # Call the service function
-        explanation_text = generate_full_code_explanation(request.code)
+        explanation_text = await generate_full_code_explanation(request.code)
         return {"full_explanation": explanation_text}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/explain_full/stream")
+async def explain_full_code_stream(request: FullExplanationRequest):
+    """
+    The /explain_full explanation as server-sent events while it is generated:
+    "token" events with {"text"}, then "end" with {"full_explanation"} or
+    "error" with {"detail"}. Disconnecting cancels the request to the model.
+    """
+    return StreamingResponse(_explanation_events(request.code), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _explanation_events(code):
+    pieces = []
+    try:
+        async with aclosing(stream_full_code_explanation(code)) as stream:
+            async for piece in stream:
+                pieces.append(piece)
+                yield _sse("token", {"text": piece})
+        yield _sse("end", {"full_explanation": "".join(pieces)})
+    except Exception as e:
+        yield _sse("error", {"detail": str(e)})
+
+def _sse(event, data):
+    return b"event: " + event.encode() + b"\ndata: " + encode_json(data) + b"\n\n"
\ No newline at end of file
@@ -1,5 +1,5 @@
-from typing import Dict, Any
-from fastapi import APIRouter
+from typing import Dict, Any, Literal
+from fastapi import APIRouter, Query
 
 # Import models
 from models.dp_models import LCSRequest, KnapsackRequest, CoinChangeRequest
@@ -7,18 +7,36 @@ from models.dp_models import LCSRequest, KnapsackRequest, CoinChangeRequest
 from tracers.lcs_tracer import trace_lcs_bottom_up, trace_lcs_top_down
 from tracers.knapsack_tracer import trace_knapsack_bottom_up, trace_knapsack_top_down
 from tracers.coin_change_tracer import trace_coin_change_bottom_up, trace_coin_change_top_down
+from executor import cpu_executor
+from result_cache import result_cache, make_key
+from json_encoding import encode_json, json_bytes_response
 
 router = APIRouter()
 
 @router.post("/visualize/{algo_id}")
-async def get_visualization(algo_id: str, request: Dict[str, Any]):
+async def get_visualization(algo_id: str, request: Dict[str, Any], frames: Literal["full", "delta"] = "full", keyframe_interval: int = Query(0, ge=0)):
+    # frames="delta" returns the top-down trees as events (tracers/recursion_tree.py)
+    # and the bottom-up tables as cell updates (tracers/grid_frames.py)
+    cache_key = make_key("dp", algo_id, request, frames, keyframe_interval)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return json_bytes_response(cached)
+    # Trace generation is CPU-bound, keep it off the event loop.
+    result = await cpu_executor.run(build_visualization, algo_id, request, frames, keyframe_interval)
+    if isinstance(result, dict):
+        body = encode_json(result)
+        result_cache.put(cache_key, body)
+        return json_bytes_response(body)
+    return result
+
+def build_visualization(algo_id: str, request: Dict[str, Any], frames: str = "full", keyframe_interval: int = 0):
     output_string = ""
     
     if algo_id == "lcs":
         parsed_request = LCSRequest(**request)
         # Call both bottom-up and top-down tracers
-        bottom_up_trace, final_value = trace_lcs_bottom_up(parsed_request.str1, parsed_request.str2)
-        top_down_trace = trace_lcs_top_down(parsed_request.str1, parsed_request.str2)
+        bottom_up_trace, final_value = trace_lcs_bottom_up(parsed_request.str1, parsed_request.str2, frames, keyframe_interval)
+        top_down_trace = trace_lcs_top_down(parsed_request.str1, parsed_request.str2, frames)
         
         output_string = f"The length of the Longest Common Subsequence is {final_value}."
         
@@ -27,8 +45,8 @@ async def get_visualization(algo_id: str, request: Dict[str, Any]):
     elif algo_id == "knapsack":
         parsed_request = KnapsackRequest(**request)
         # Call both bottom-up and top-down tracers
-        bottom_up_trace, final_value = trace_knapsack_bottom_up(parsed_request.weights, parsed_request.values, parsed_request.capacity)
-        top_down_trace = trace_knapsack_top_down(parsed_request.weights, parsed_request.values, parsed_request.capacity)
+        bottom_up_trace, final_value = trace_knapsack_bottom_up(parsed_request.weights, parsed_request.values, parsed_request.capacity, frames, keyframe_interval)
+        top_down_trace = trace_knapsack_top_down(parsed_request.weights, parsed_request.values, parsed_request.capacity, frames)
 
         output_string = f"The maximum value that can be carried is {final_value}."
         
@@ -38,7 +56,7 @@ async def get_visualization(algo_id: str, request: Dict[str, Any]):
         parsed_request = CoinChangeRequest(**request)
         # Call both bottom-up and top-down tracers
         bottom_up_trace, final_value = trace_coin_change_bottom_up(parsed_request.coins, parsed_request.amount)
-        top_down_trace = trace_coin_change_top_down(parsed_request.coins, parsed_request.amount)
+        top_down_trace = trace_coin_change_top_down(parsed_request.coins, parsed_request.amount, frames)
         
         if final_value == float('inf'):
             output_string = f"It's not possible to make the amount {parsed_request.amount} with the given coins."
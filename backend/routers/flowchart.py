@@ -1,14 +1,28 @@
 from fastapi import APIRouter, HTTPException
 from pyflowchart import Flowchart
 from models.flowchart_models import CodeInput
+from executor import cpu_executor, ExecutorSaturated
+from result_cache import result_cache, make_key, normalize_code
+from json_encoding import encode_json, json_bytes_response
 
 router = APIRouter()
 
+def build_flowchart(code: str):
+    fc = Flowchart.from_code(code)
+    return fc.flowchart()
+
 @router.post("/generate")
 async def generate_flowchart(payload: CodeInput):
+    cache_key = make_key("generate", normalize_code(payload.code))
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return json_bytes_response(cached)
     try:
-        fc = Flowchart.from_code(payload.code)
-        flowchart_syntax = fc.flowchart()
-        return {"flowchart_code": flowchart_syntax}
+        flowchart_syntax = await cpu_executor.run(build_flowchart, payload.code)
+        body = encode_json({"flowchart_code": flowchart_syntax})
+        result_cache.put(cache_key, body)
+        return json_bytes_response(body)
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
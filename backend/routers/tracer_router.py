@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException
+import math
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from models.code_models import CodeInput
-from tracer_core import run_with_trace
-from tracer_core import generate_simple_flowchart
+from tracer_core import generate_simple_flowchart, TraceBudget, TraceScope
+from sandbox import sandbox_pool, SandboxError, SandboxTimeout, SANDBOX_CPU_SECONDS
+from executor import cpu_executor, ExecutorSaturated
+from result_cache import result_cache, make_key, normalize_code, is_deterministic
+from json_encoding import encode_json, json_bytes_response, FastJSONResponse
+from trace_sessions import trace_sessions, TraceSessionNotFound, TRACE_SESSION_MAX_STEPS, TRACE_SESSION_MAX_SECONDS
 
 router = APIRouter()
 
@@ -10,26 +17,166 @@ async def trace_code(payload: CodeInput):
     """
     Receives Python code, executes it with a tracer, and returns the trace.
     """
+    cacheable = is_deterministic(payload.code)
+    cache_key = make_key("trace", normalize_code(payload.code), payload.trace_format, payload.heap, _scope_key(payload), payload.loop_keep, payload.capture)
+    if cacheable:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return json_bytes_response(cached)
     try:
-        result = run_with_trace(payload.code)
+        # Runs in a sandbox worker process, never inside the API process.
+        result = await sandbox_pool.submit("trace", payload.code, payload.trace_format, heap=payload.heap, scope=_scope(payload), loop_keep=payload.loop_keep, capture=payload.capture)
         # If the trace captured an error during execution, return a 400 status
         if any('error' in step for step in result.get('trace', [])):
             error_step = next((step for step in result['trace'] if 'error' in step), None)
             raise HTTPException(status_code=400, detail=error_step.get('error', 'Execution error'))
-        
-        return result
+
+        if cacheable and not _stopped_by_resource_limit(result):
+            body = encode_json(result)
+            result_cache.put(cache_key, body)
+            return json_bytes_response(body)
+        return FastJSONResponse(result)
+    except (HTTPException, ExecutorSaturated):
+        raise
+    except SandboxTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SandboxError as e:
+        raise HTTPException(status_code=500, detail=f"Execution sandbox failed: {str(e)}")
     except Exception as e:
         # For unexpected errors in the tracer service itself
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
 
+@router.post("/trace/stream")
+async def trace_code_stream(payload: CodeInput, stream_format: Literal["ndjson", "sse"] = "ndjson"):
+    """
+    Same trace as /trace, sent step by step while the program runs.
+
+    ndjson: one JSON object per line, {"type": "step", "index", "step"} for each
+    step, then {"type": "end", "output", "call_tree", "loop_context_map", ...}
+    or {"type": "error", "status", "detail"}.
+    sse: the same objects as `data:` of "step", "end" and "error" events.
+    """
+    # Streams are never cached: the point is to see the first steps early.
+    steps = sandbox_pool.stream("trace_stream", payload.code, payload.trace_format, heap=payload.heap, scope=_scope(payload), loop_keep=payload.loop_keep, capture=payload.capture)
+    if stream_format == "sse":
+        return StreamingResponse(_sse_lines(steps), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(_ndjson_lines(steps), media_type="application/x-ndjson")
+
+async def _trace_events(steps):
+    index = 0
+    try:
+        async for kind, item in steps:
+            if kind == "item":
+                yield {"type": "step", "index": index, "step": item}
+                index += 1
+            else:
+                yield {"type": "end", **item}
+    except SandboxTimeout as e:
+        yield {"type": "error", "status": 504, "detail": str(e)}
+    except SandboxError as e:
+        yield {"type": "error", "status": 500, "detail": f"Execution sandbox failed: {str(e)}"}
+    finally:
+        await steps.aclose()
+
+async def _ndjson_lines(steps):
+    async for event in _trace_events(steps):
+        yield encode_json(event) + b"\n"
+
+async def _sse_lines(steps):
+    async for event in _trace_events(steps):
+        yield b"event: " + event["type"].encode() + b"\ndata: " + encode_json(event) + b"\n\n"
+
+# --- Trace Sessions ---
+# For long traces: run once, keep the steps on the server and let the client
+# fetch them a window at a time. Sessions always store full-format steps.
+@router.post("/trace/session")
+async def create_trace_session(payload: CodeInput):
+    session = trace_sessions.new_session()
+    budget = TraceBudget(max_steps=TRACE_SESSION_MAX_STEPS, max_seconds=TRACE_SESSION_MAX_SECONDS)
+    summary = None
+    try:
+        summary = await sandbox_pool.submit(
+            "trace_stream", payload.code, budget=budget, scope=_scope(payload), loop_keep=payload.loop_keep, capture=payload.capture, on_item=session.add_step,
+            timeout=TRACE_SESSION_MAX_SECONDS + sandbox_pool.job_timeout,
+            # The worker's CPU limit must not cut the session short of its own budget.
+            cpu_seconds=math.ceil(TRACE_SESSION_MAX_SECONDS) + SANDBOX_CPU_SECONDS,
+        )
+    except ExecutorSaturated:
+        raise
+    except SandboxTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SandboxError as e:
+        raise HTTPException(status_code=500, detail=f"Execution sandbox failed: {str(e)}")
+    finally:
+        # Chunks already spilled while tracing must not outlive a failed session.
+        if summary is None:
+            trace_sessions.discard(session)
+    trace_sessions.add(session, summary)
+    return FastJSONResponse({"session_id": session.id, "step_count": session.step_count, "ttl": trace_sessions.ttl, **summary})
+
+@router.get("/trace/{session_id}/steps")
+def get_trace_steps(session_id: str, start: int = Query(0, alias="from", ge=0), stop: Optional[int] = Query(None, alias="to", ge=0)):
+    """
+    Steps `from` (inclusive) to `to` (exclusive) of a trace session, at most
+    TRACE_SESSION_MAX_WINDOW at a time. A session never changes, so windows can
+    be cached by the client.
+    """
+    try:
+        session, start, stop, steps = trace_sessions.window(session_id, start, stop if stop is not None else start + 100)
+    except TraceSessionNotFound:
+        raise HTTPException(status_code=404, detail="Trace session not found or expired.")
+    head = encode_json({"session_id": session.id, "from": start, "to": stop, "step_count": session.step_count})
+    body = head[:-1] + b',"steps":[' + b",".join(steps) + b"]}"
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": f"private, max-age={int(trace_sessions.ttl)}"})
+
+@router.get("/trace/{session_id}/steps/{index}")
+def seek_trace_step(session_id: str, index: int):
+    try:
+        session, start, stop, steps = trace_sessions.window(session_id, index, index + 1)
+    except TraceSessionNotFound:
+        raise HTTPException(status_code=404, detail="Trace session not found or expired.")
+    if not steps or index < 0:
+        raise HTTPException(status_code=404, detail=f"Step {index} is out of range (0-{session.step_count - 1}).")
+    body = encode_json({"session_id": session.id, "index": index, "step_count": session.step_count})[:-1] + b',"step":' + steps[0] + b"}"
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": f"private, max-age={int(trace_sessions.ttl)}"})
+
+@router.delete("/trace/{session_id}")
+def delete_trace_session(session_id: str):
+    try:
+        trace_sessions.remove(session_id)
+    except TraceSessionNotFound:
+        raise HTTPException(status_code=404, detail="Trace session not found or expired.")
+    return {"deleted": session_id}
+
+def _scope(payload):
+    return TraceScope(payload.scope.functions, payload.scope.lines) if payload.scope else None
+
+def _scope_key(payload):
+    return [sorted(payload.scope.functions), sorted(payload.scope.lines)] if payload.scope else None
+
+def _stopped_by_resource_limit(result):
+    # Time and memory budgets depend on server load, so those partial traces are not cached.
+    trace = result.get('trace') or [{}]
+    event = trace[-1].get('event', {})
+    return event.get('type') == 'budget_exceeded' and event.get('limit') != 'max_steps'
+
 @router.post("/flowchart")
 async def create_flowchart(payload: CodeInput):
     """
     Receives Python code and returns a Mermaid.js flowchart string.
     """
+    # The Mermaid output quotes source lines verbatim, so key on the raw code.
+    cache_key = make_key("flowchart", payload.code)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return json_bytes_response(cached)
     try:
-        mermaid_code = generate_simple_flowchart(payload.code)
-        return {"mermaid": mermaid_code}
+        mermaid_code = await cpu_executor.run(generate_simple_flowchart, payload.code)
+        body = encode_json({"mermaid": mermaid_code})
+        result_cache.put(cache_key, body)
+        return json_bytes_response(body)
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate flowchart: {str(e)}")
         
\ No newline at end of file
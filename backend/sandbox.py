@@ -0,0 +1,340 @@
+import asyncio
+import concurrent.futures
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from executor import BoundedExecutor
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, the wall-clock timeout still applies
+    resource = None
+
+# --- Configuration ---
+SANDBOX_WORKERS = int(os.environ.get("SANDBOX_WORKERS", os.cpu_count() or 2))
+SANDBOX_JOB_TIMEOUT = float(os.environ.get("SANDBOX_JOB_TIMEOUT", 15))
+SANDBOX_MAX_JOBS_PER_WORKER = int(os.environ.get("SANDBOX_MAX_JOBS_PER_WORKER", 50))
+SANDBOX_MEMORY_MB = int(os.environ.get("SANDBOX_MEMORY_MB", 1024))
+SANDBOX_CPU_SECONDS = int(os.environ.get("SANDBOX_CPU_SECONDS", 20))
+SANDBOX_MAX_QUEUE = int(os.environ.get("SANDBOX_MAX_QUEUE", 16))
+# Items a streaming job may have waiting for the client before the worker is
+# paused (the pipe itself buffers a little more).
+SANDBOX_STREAM_BUFFER = int(os.environ.get("SANDBOX_STREAM_BUFFER", 64))
+
+# Jobs are looked up by name inside the worker, so only plain arguments cross
+# the process boundary.
+JOBS = {
+    "trace": ("tracer_core", "run_with_trace"),
+    # Streaming jobs get an `emit` callback; see SandboxPool.stream.
+    "trace_stream": ("tracer_core", "stream_trace"),
+    "analyze": ("complexity_core", "analyze_code_job"),
+}
+# Jobs that take an `on_stuck(result)` callback. It is called from another
+# thread when the traced program keeps running after its budget is spent
+# (see tracer_core._Backstop); the worker sends that result and exits, and the
+# pool replaces it.
+STUCK_JOBS = {"trace", "trace_stream"}
+
+class SandboxError(Exception):
+    pass
+
+class SandboxTimeout(SandboxError):
+    pass
+
+class SandboxCrashed(SandboxError):
+    pass
+
+class SandboxCancelled(SandboxError):
+    pass
+
+# --- Worker Process ---
+def _limit_memory(memory_mb):
+    if resource is None or not memory_mb:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _limit_cpu(cpu_seconds):
+    # RLIMIT_CPU counts the whole life of the process, so move the soft limit
+    # forward before every job. Going over it kills the worker with SIGXCPU.
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _own_process_group(pid=0):
+    # A worker leads its own process group so that _Worker.kill() also ends
+    # the profiling children of an analysis job, which would otherwise be
+    # orphaned. Set from both sides of the fork, whichever runs first.
+    if hasattr(os, "setpgid"):
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+def _abandon(conn, send_lock, result):
+    with send_lock:
+        _send_result(conn, result, "abandoned")
+    os._exit(0)
+
+def _send_result(conn, result, status="ok"):
+    try:
+        conn.send((status, result))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # Traces may hold instances of classes defined by the user's code, which
+        # cannot be unpickled in the parent. Fall back to their repr().
+        conn.send((status, json.loads(json.dumps(result, default=repr))))
+
+def _worker_main(conn, memory_mb, cpu_seconds):
+    # Analysis jobs fork a child process per input size (see
+    # profile_sizes_parallel). Workers are single-threaded, so fork is safe here
+    # and much cheaper than spawn.
+    if "fork" in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method("fork", force=True)
+    _own_process_group()
+    _limit_memory(memory_mb)
+    functions = {}
+    # Streamed items go out on the job's thread, an abandoned job's result on the backstop's.
+    send_lock = threading.Lock()
+
+    def send_item(item):
+        with send_lock:
+            _send_result(conn, item, "item")
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        job, args, kwargs, stream, job_cpu_seconds = message
+        if stream:
+            # Blocks once the pipe is full, which pauses the job until the
+            # parent catches up.
+            kwargs["emit"] = send_item
+        if job in STUCK_JOBS:
+            kwargs["on_stuck"] = lambda result: _abandon(conn, send_lock, result)
+        _limit_cpu(job_cpu_seconds or cpu_seconds)
+        try:
+            if job not in functions:
+                module_name, func_name = JOBS[job]
+                functions[job] = getattr(importlib.import_module(module_name), func_name)
+            result = functions[job](*args, **kwargs)
+        except BaseException as e:
+            with send_lock:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+            continue
+        with send_lock:
+            _send_result(conn, result)
+    conn.close()
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            # Not a daemon: analysis jobs start child processes of their own.
+            args=(child_conn, SANDBOX_MEMORY_MB, SANDBOX_CPU_SECONDS),
+        )
+        self.process.start()
+        _own_process_group(self.process.pid)
+        child_conn.close()
+        self.jobs_done = 0
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def run(self, job, args, kwargs, timeout, on_item=None, cpu_seconds=None):
+        # With `on_item`, the job streams items before its result and on_item is
+        # called with each of them; the timeout covers the whole job.
+        # `cpu_seconds` replaces SANDBOX_CPU_SECONDS for this job.
+        self.jobs_done += 1
+        self.conn.send((job, args, kwargs, on_item is not None, cpu_seconds))
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.conn.poll(max(0, deadline - time.monotonic())):
+                self.kill()
+                raise SandboxTimeout(f"Job '{job}' did not finish within {timeout} seconds.")
+            try:
+                status, payload = self.conn.recv()
+            except EOFError:
+                self.kill()
+                raise SandboxCrashed(f"Worker exited with code {self.process.exitcode} (resource limit exceeded or crash).")
+            if status == "abandoned":
+                # The job is still running in the worker, which is exiting.
+                self.kill()
+                return payload
+            if status != "item":
+                break
+            try:
+                on_item(payload)
+            except BaseException:
+                # The job is still running; the worker cannot be reused.
+                self.kill()
+                raise
+        if status == "error":
+            raise SandboxError(payload)
+        return payload
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            self.process.kill()
+        self.process.join()
+
+# --- Pool ---
+class SandboxPool:
+    """
+    Pre-forked worker processes that run untrusted code for /trace and
+    /analyze_code. Each pool thread owns one worker and feeds it one job at a
+    time; a worker is killed on timeout and replaced after `max_jobs_per_worker`
+    jobs. Submissions beyond `max_queue` waiting jobs raise ExecutorSaturated.
+    """
+
+    def __init__(self, workers=SANDBOX_WORKERS, job_timeout=SANDBOX_JOB_TIMEOUT, max_jobs_per_worker=SANDBOX_MAX_JOBS_PER_WORKER, max_queue=SANDBOX_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        # "spawn" keeps workers free of the server's threads and sockets.
+        self._context = multiprocessing.get_context("spawn")
+        self._ready = queue.Queue()
+        self._local = threading.local()
+        self._all = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = BoundedExecutor("sandbox", workers=self.workers, max_queue=self.max_queue)
+            for _ in range(self.workers):
+                self._ready.put(self._spawn())
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is None:
+                return
+            self._executor.shutdown()
+            self._executor = None
+            for worker in list(self._all):
+                worker.stop()
+            self._all.clear()
+            self._ready = queue.Queue()
+
+    def _spawn(self):
+        worker = _Worker(self._context)
+        self._all.add(worker)
+        return worker
+
+    def _retire(self, worker):
+        self._all.discard(worker)
+        worker.stop()
+
+    def _run(self, job, args, kwargs, timeout, on_item=None, cpu_seconds=None):
+        worker = getattr(self._local, "worker", None)
+        if worker is None or not worker.alive:
+            if worker is not None:
+                self._retire(worker)
+            try:
+                worker = self._ready.get_nowait()
+            except queue.Empty:
+                worker = self._spawn()
+            self._local.worker = worker
+        try:
+            return worker.run(job, args, kwargs, timeout, on_item, cpu_seconds)
+        finally:
+            if not worker.alive or worker.jobs_done >= self.max_jobs_per_worker:
+                self._retire(worker)
+                self._local.worker = None
+
+    async def submit(self, job, *args, timeout=None, on_item=None, cpu_seconds=None, **kwargs):
+        """
+        Runs `job` (a key of JOBS) in a worker process and returns its result.
+        For streaming jobs, `on_item` is called on a pool thread with each item.
+        Jobs allowed to run longer than usual raise `timeout` and `cpu_seconds`.
+        """
+        self.start()
+        return await self._executor.run(self._run, job, args, kwargs, timeout or self.job_timeout, on_item, cpu_seconds)
+
+    def stream(self, job, *args, timeout=None, **kwargs):
+        """
+        Runs a streaming job and returns an async iterator of ("item", item)
+        tuples followed by ("end", result). The job is admitted (or rejected with
+        ExecutorSaturated) before this returns. The worker pauses while
+        `SANDBOX_STREAM_BUFFER` items are waiting, and closing the iterator before
+        the end kills it.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue(maxsize=SANDBOX_STREAM_BUFFER)
+        cancelled = threading.Event()
+
+        def on_item(item):
+            # Called on the pool thread; waits for room in the queue.
+            put = asyncio.run_coroutine_threadsafe(items.put(item), loop)
+            while True:
+                try:
+                    return put.result(timeout=0.1)
+                except concurrent.futures.TimeoutError:
+                    if cancelled.is_set():
+                        put.cancel()
+                        raise SandboxCancelled(f"Job '{job}' was cancelled.")
+
+        done = self._executor.submit(self._run, job, args, kwargs, timeout or self.job_timeout, on_item)
+        # Nobody awaits the result once the client is gone.
+        done.add_done_callback(lambda future: future.cancelled() or future.exception())
+        return self._stream_items(items, done, cancelled)
+
+    async def _stream_items(self, items, done, cancelled):
+        getter = None
+        try:
+            while True:
+                # on_item returns only after its item is queued, so once the job
+                # is done everything it sent is already in `items`.
+                if done.done() and items.empty():
+                    yield "end", done.result()
+                    return
+                getter = asyncio.ensure_future(items.get())
+                await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield "item", getter.result()
+                else:
+                    getter.cancel()
+        finally:
+            cancelled.set()
+            if getter is not None:
+                getter.cancel()
+
+    def metrics(self):
+        executor = self._executor
+        metrics = executor.metrics() if executor else {"workers": self.workers, "in_flight": 0, "queue_depth": 0}
+        metrics["live_processes"] = len(self._all)
+        return metrics
+
+sandbox_pool = SandboxPool()
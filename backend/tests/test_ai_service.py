@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import ai_service
+from ai_service import ExplanationBackend, ExplanationClient, RetryableError
+
+# The fake backend's own waits, unaffected by the `delays` fixture.
+_sleep = asyncio.sleep
+
+class FakeBackend(ExplanationBackend):
+    """Fails with each of `failures` in turn, then answers; streams `pieces` one at a time."""
+
+    def __init__(self, failures=(), pieces=("a", "b", "c"), delay=0):
+        self.failures = list(failures)
+        self.pieces = pieces
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.stream_closed = False
+
+    async def complete(self, messages, model, temperature, max_tokens):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await _sleep(self.delay)
+            if self.failures:
+                raise self.failures.pop(0)
+            return "".join(self.pieces)
+        finally:
+            self.running -= 1
+
+    async def stream(self, messages, model, temperature, max_tokens):
+        self.calls += 1
+        try:
+            for piece in self.pieces:
+                await _sleep(self.delay)
+                yield piece
+        finally:
+            self.stream_closed = True
+
+@pytest.fixture
+def delays(monkeypatch):
+    """The backoff delays, recorded instead of slept."""
+    slept = []
+
+    async def sleep(seconds, *args):
+        slept.append(seconds)
+        await _sleep(0)
+
+    monkeypatch.setattr(ai_service.asyncio, "sleep", sleep)
+    # Jitter picks the top of its range so the expected delays are exact.
+    monkeypatch.setattr(ai_service.random, "uniform", lambda low, high: high)
+    return slept
+
+def test_backend_must_implement_complete():
+    with pytest.raises(TypeError):
+        ExplanationBackend()
+
+def test_rate_limits_and_server_errors_are_retried_with_backoff(delays):
+    backend = FakeBackend(failures=[RetryableError("429 Too Many Requests"), RetryableError("503 Service Unavailable")])
+    client = ExplanationClient(backend, max_retries=3, base_delay=0.5, max_delay=8)
+    assert asyncio.run(client.complete([])) == "abc"
+    assert delays == [0.5, 1.0]
+    assert (backend.calls, client.retries, client.failed) == (3, 2, 0)
+
+def test_backoff_is_jittered_below_the_exponential_cap(monkeypatch):
+    ranges = []
+    monkeypatch.setattr(ai_service.random, "uniform", lambda low, high: ranges.append((low, high)) or 0)
+    backend = FakeBackend(failures=[RetryableError("500")] * 5)
+    client = ExplanationClient(backend, max_retries=5, base_delay=0.001, max_delay=0.004)
+    assert asyncio.run(client.complete([])) == "abc"
+    assert ranges == [(0, 0.001), (0, 0.002), (0, 0.004), (0, 0.004), (0, 0.004)]
+
+def test_retry_after_is_honoured_up_to_the_max_delay(delays):
+    backend = FakeBackend(failures=[RetryableError("429", retry_after=3), RetryableError("429", retry_after=60)])
+    client = ExplanationClient(backend, max_retries=3, base_delay=0.5, max_delay=8)
+    asyncio.run(client.complete([]))
+    assert delays == [3, 8]
+
+def test_retries_give_up_after_max_retries(delays):
+    backend = FakeBackend(failures=[RetryableError("502")] * 5)
+    client = ExplanationClient(backend, max_retries=2)
+    with pytest.raises(RetryableError):
+        asyncio.run(client.complete([]))
+    assert (backend.calls, client.failed) == (3, 1)
+
+def test_permanent_errors_are_not_retried(delays):
+    backend = FakeBackend(failures=[ValueError("400 Bad Request")])
+    client = ExplanationClient(backend)
+    with pytest.raises(ValueError):
+        asyncio.run(client.complete([]))
+    assert (backend.calls, client.retries, delays) == (1, 0, [])
+
+def test_concurrency_is_limited_by_the_semaphore():
+    backend = FakeBackend(delay=0.01)
+    client = ExplanationClient(backend, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(client.complete([]) for _ in range(6)))
+
+    assert asyncio.run(run()) == ["abc"] * 6
+    assert backend.max_running == 2
+    assert client.metrics()["in_flight"] == 0
+
+def test_abandoned_stream_closes_the_backend_stream():
+    backend = FakeBackend(delay=0.001)
+    client = ExplanationClient(backend, max_concurrency=1)
+
+    async def run():
+        stream = client.stream([])
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(run()) == "a"
+    assert backend.stream_closed
+    assert (client.cancelled, client.completed, client.metrics()["in_flight"]) == (1, 0, 0)
+    # The slot was released: the next request still gets through.
+    assert asyncio.run(client.complete([])) == "abc"
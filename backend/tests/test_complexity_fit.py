@@ -0,0 +1,84 @@
+import math
+
+import pytest
+
+import complexity_core
+from complexity_core import fit_complexity, time_call
+
+MODELS = {
+    "O(n)": lambda n: n,
+    "O(n log n)": lambda n: n * math.log(n),
+    "O(n^2)": lambda n: n * n,
+}
+SIZES = [10, 20, 40, 80, 160]
+WIDE_SIZES = [10, 40, 160, 640, 2560, 10240, 40960]
+# A fixed +-4% disturbance, so the noisy fits are the same on every run.
+NOISE = [1.04, 0.97, 1.03, 0.96, 1.02, 0.98, 1.01]
+
+def _series(model, sizes, noise=None):
+    values = [1e-6 + 2e-8 * MODELS[model](n) for n in sizes]
+    return [value * k for value, k in zip(values, noise)] if noise else values
+
+@pytest.mark.parametrize("model", sorted(MODELS))
+def test_exact_series_are_fitted_with_full_confidence(model):
+    fit = fit_complexity(SIZES, _series(model, SIZES))
+    assert (fit["complexity"], fit["confidence"], fit["ambiguous"]) == (model, 1.0, False)
+    assert fit["candidates"][0]["complexity"] == model
+
+@pytest.mark.parametrize("model", sorted(MODELS))
+def test_noisy_series_over_a_wide_range_are_fitted(model):
+    fit = fit_complexity(WIDE_SIZES, _series(model, WIDE_SIZES, NOISE))
+    assert fit["complexity"] == model and not fit["ambiguous"]
+
+def test_noisy_quadratic_is_told_apart_over_a_narrow_range():
+    fit = fit_complexity(SIZES, _series("O(n^2)", SIZES, NOISE))
+    assert fit["complexity"] == "O(n^2)"
+    assert fit["confidence"] == pytest.approx(0.889, abs=0.001)
+
+def test_noisy_linear_over_a_narrow_range_is_ambiguous():
+    # +-4% cannot separate n from n log n between 10 and 160; the simpler model
+    # is reported, flagged ambiguous so larger sizes get measured.
+    fit = fit_complexity(SIZES, _series("O(n)", SIZES, NOISE))
+    assert fit["complexity"] == "O(n)" and fit["ambiguous"]
+    assert fit["candidates"][0]["complexity"] == "O(n log n)"
+
+def test_growth_within_the_noise_is_constant():
+    values = [1e-3 * k for k in NOISE[:5]]
+    assert fit_complexity(SIZES, values)["complexity"] == "O(1)"
+    assert fit_complexity(SIZES, _series("O(n)", SIZES), noise=1e-5)["complexity"] == "O(1)"
+
+def test_too_few_points_give_no_fit():
+    assert fit_complexity([10, 20, 40], [1.0, None, 3.0]) is None
+    assert fit_complexity([10, 10, 20], [1.0, 1.1, 2.0]) is None
+
+def _fake_samples(monkeypatch, durations):
+    """Makes each timed sample take the next of `durations` seconds in total."""
+    durations = iter(durations)
+    calls = []
+    def sample(func, n, number):
+        calls.append(number)
+        return next(durations)
+    monkeypatch.setattr(complexity_core, "_sample", sample)
+    return calls
+
+def test_outliers_are_dropped_before_the_statistics(monkeypatch):
+    # One calibration sample, then TIMING_REPEAT samples with one far outlier.
+    _fake_samples(monkeypatch, [0.01, 0.010, 0.011, 0.009, 0.010, 0.050, 0.0105, 0.0095])
+    stats = time_call(None, 10, budget=60)
+    assert (stats["samples"], stats["outliers"], stats["number"]) == (6, 1, 1)
+    assert stats["median"] == pytest.approx(0.010)
+    assert (stats["q1"], stats["q3"], stats["min"]) == pytest.approx((0.009625, 0.010375, 0.009))
+    assert stats["iqr"] == pytest.approx(0.00075)
+
+def test_calls_are_batched_up_to_the_minimum_sample(monkeypatch):
+    monkeypatch.setattr(complexity_core, "TIMING_REPEAT", 3)
+    calls = _fake_samples(monkeypatch, [1e-4, 51e-4, 51e-4, 51e-4, 51e-4])
+    stats = time_call(None, 10, budget=60)
+    assert calls == [1, 51, 51, 51, 51]
+    assert stats["median"] == pytest.approx(1e-4) and stats["samples"] == 3
+
+def test_without_budget_the_calibration_sample_is_used(monkeypatch):
+    calls = _fake_samples(monkeypatch, [0.02])
+    stats = time_call(None, 10, budget=0)
+    assert calls == [1]
+    assert (stats["median"], stats["samples"], stats["outliers"]) == (0.02, 1, 0)
@@ -0,0 +1,35 @@
+import pytest
+
+from tracer_core import DeltaTraceEncoder, expand_delta_trace, materialize_delta_step, trace_program
+
+PROGRAMS = {
+    "swaps": "a = [5, 3, 8, 1, 9, 2, 7, 4, 6, 0] * 3\nfor i in range(len(a)):\n    for j in range(len(a) - 1 - i):\n        if a[j] > a[j + 1]:\n            a[j], a[j + 1] = a[j + 1], a[j]\n",
+    "append_pop": "stack = []\nfor i in range(30):\n    stack.append(i)\n    if i % 3 == 0:\n        stack.pop()\n",
+    "dict": "d = {}\nfor i in range(60):\n    d[i % 7] = d.get(i % 7, 0) + i\n    if i % 10 == 9:\n        del d[i % 7]\n",
+    "recursion": "def fib(n):\n    if n < 2:\n        return n\n    return fib(n - 1) + fib(n - 2)\nx = fib(7)\n",
+}
+
+def _both_formats(code, keyframe_interval):
+    """One run of `code`, as full steps and as the delta encoding of the same steps."""
+    full, delta = [], []
+    encoder = DeltaTraceEncoder(keyframe_interval)
+    def emit(step, frame_key):
+        full.append({key: step[key] for key in ("line", "event", "locals", "stack")})
+        delta.append(encoder.encode(step, frame_key))
+        if step["event"].get("type") == "return_value":
+            encoder.forget(frame_key)
+    trace_program(code, emit)
+    return full, delta
+
+@pytest.mark.parametrize("keyframe_interval", [3, 50])
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_delta_trace_expands_to_the_full_trace(name, keyframe_interval):
+    full, delta = _both_formats(PROGRAMS[name], keyframe_interval)
+    assert expand_delta_trace(delta) == full
+    for index in (0, len(full) // 2, len(full) - 1):
+        assert materialize_delta_step(delta, index) == full[index]
+
+def test_small_container_changes_are_sent_as_patches():
+    full, delta = _both_formats(PROGRAMS["swaps"], 50)
+    assert any("patch" in step for step in delta)
+    assert any("stack_keep" in step for step in _both_formats(PROGRAMS["recursion"], 50)[1])
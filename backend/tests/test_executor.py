@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from executor import BoundedExecutor, ExecutorSaturated, EXECUTOR_RETRY_AFTER, cpu_executor
+
+def test_jobs_beyond_the_queue_are_rejected_until_one_finishes():
+    executor = BoundedExecutor("test", workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        running = executor.submit(release.wait)
+        queued = executor.submit(lambda: "queued")
+        with pytest.raises(ExecutorSaturated) as rejected:
+            executor.submit(lambda: "rejected")
+        assert executor.metrics()["in_flight"] == 1 and executor.metrics()["queue_depth"] == 1
+        release.set()
+        await asyncio.gather(running, queued)
+        return rejected.value, await executor.submit(lambda: "after")
+
+    rejected, after = asyncio.run(run())
+    executor.shutdown()
+    assert rejected.retry_after > 0 and after == "after"
+    assert executor.metrics()["rejected"] == 1 and executor.metrics()["completed"] == 3
+
+def test_saturated_executor_answers_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(cpu_executor, "workers", 0)
+    monkeypatch.setattr(cpu_executor, "max_queue", 0)
+    response = TestClient(main.app).post("/generate", json={"code": "saturated = 503\n"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(EXECUTOR_RETRY_AFTER)
+    assert "busy" in response.json()["detail"]
@@ -0,0 +1,12 @@
+from explanation_cache import canonicalize
+
+def test_renamed_identifiers_share_a_key():
+    assert canonicalize("total = 0\nfor x in arr:\n    total += x\n")[0] == canonicalize("s = 0\nfor v in items:\n    s += v\n")[0]
+
+def test_dunder_methods_are_kept():
+    template = "class A:\n    def {}(self):\n        self.x = 1\n"
+    keys = {canonicalize(template.format(name))[0] for name in ("__init__", "setup", "__str__")}
+    assert len(keys) == 3
+
+def test_keyword_names_are_kept():
+    assert canonicalize("key = 1\nsorted(a, key=abs)\n")[0] != canonicalize("k = 1\nsorted(a, k=abs)\n")[0]
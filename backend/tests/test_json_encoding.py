@@ -0,0 +1,24 @@
+import json
+import math
+
+import pytest
+
+import json_encoding
+from json_encoding import encode_json
+
+CONTENT = {"big": math.factorial(25), "nan": float("nan"), "inf": [float("inf"), -float("inf"), 1.5], "nested": {"n": float("nan")}}
+EXPECTED = {"big": math.factorial(25), "nan": None, "inf": [None, None, 1.5], "nested": {"n": None}}
+
+def test_big_int_and_non_finite_floats():
+    assert json.loads(encode_json(CONTENT)) == EXPECTED
+
+def test_stdlib_fallback_matches(monkeypatch):
+    monkeypatch.setattr(json_encoding, "orjson", None)
+    assert json.loads(encode_json(CONTENT)) == EXPECTED
+
+@pytest.mark.skipif(json_encoding.orjson is None, reason="orjson is not installed")
+def test_orjson_and_stdlib_agree_on_non_finite_floats(monkeypatch):
+    content = {"values": [float("nan"), 2.0], 1: "int key"}
+    fast = encode_json(content)
+    monkeypatch.setattr(json_encoding, "orjson", None)
+    assert encode_json(content) == fast
@@ -0,0 +1,26 @@
+from tracer_core import trace_program
+
+def _iterations(code):
+    steps = []
+    result = trace_program(code, lambda step, frame_key: steps.append(step))
+    return [step["event"] for step in steps if step["event"]["type"] == "loop_iteration"], result["output"]
+
+def _values(snapshot):
+    return [item["value"] for item in snapshot]
+
+def test_range_of_len_gets_a_snapshot():
+    events, _ = _iterations("arr = [5, 6, 7]\nfor i in range(len(arr)):\n    x = arr[i]\n")
+    assert _values(events[0]["iterable_snapshot"]) == [0, 1, 2]
+    assert [event.get("snapshot_step") for event in events] == [events[0]["snapshot_step"]] * 3
+    assert all("iterable_snapshot" not in event for event in events[1:])
+
+def test_range_of_len_is_not_evaluated_again_after_the_list_changes():
+    events, _ = _iterations("arr = [5, 6, 7]\nfor i in range(len(arr)):\n    arr.append(i)\n")
+    assert _values(events[0]["iterable_snapshot"]) == [0, 1, 2]
+    assert all("iterable_snapshot" not in event for event in events[1:])
+
+def test_shadowed_len_is_not_called():
+    code = "def len(a):\n    print('called')\n    return 2\narr = [5, 6, 7]\nfor i in range(len(arr)):\n    x = i\n"
+    events, output = _iterations(code)
+    assert output.count("called") == 1
+    assert all("iterable_snapshot" not in event for event in events)
@@ -0,0 +1,28 @@
+from tracer_core import TraceBudget, trace_program
+
+def _trace(code, **kwargs):
+    steps = []
+    trace_program(code, lambda step, frame_key: steps.append(step), **kwargs)
+    return steps
+
+def _summaries(steps):
+    return [step["event"] for step in steps if step["event"]["type"] == "loop_summary"]
+
+def test_known_length_loop_keeps_first_and_last_iterations():
+    steps = _trace("total = 0\nfor i in range(100):\n    total += i\n", loop_keep=2)
+    (summary,) = _summaries(steps)
+    assert (summary["first_iteration"], summary["last_iteration"], summary["iterations"]) == (3, 98, 96)
+    assert summary["variables"]["total"]["max"] == sum(range(98))
+    assert steps[-2]["locals"]["total"]["value"] == sum(range(100))
+
+def test_loop_that_breaks_keeps_its_last_iterations():
+    code = "for i in range(100):\n    x = i\n    if i == 10:\n        break\n"
+    steps = _trace(code, loop_keep=2)
+    (summary,) = _summaries(steps)
+    assert summary["last_iteration"] == 9
+    assert steps[-2]["locals"]["i"]["value"] == 10
+
+def test_left_out_iterations_count_against_the_step_budget():
+    steps = _trace("while True:\n    x = 1\n", loop_keep=2, budget=TraceBudget(max_steps=200, max_seconds=30))
+    assert steps[-1]["event"]["type"] == "budget_exceeded"
+    assert steps[-1]["event"]["limit"] == "max_steps"
@@ -0,0 +1,33 @@
+import time
+
+from complexity_core import profile_sizes, profile_sizes_parallel
+
+def _fib(n):
+    return n if n < 2 else _fib(n - 1) + _fib(n - 2)
+
+def test_profiling_stops_at_its_deadline_with_partial_results():
+    start = time.perf_counter()
+    time_stats, memory_stats = profile_sizes(_fib, [5, 10, 40], deadline=start + 1.5)
+    assert time.perf_counter() - start < 3
+    assert time_stats[0]["median"] is not None and time_stats[1]["median"] is not None
+    assert time_stats[2].get("timed_out") and time_stats[2]["median"] is None
+    assert memory_stats[2].get("timed_out")
+
+def test_parallel_profiling_fits_its_budget():
+    start = time.perf_counter()
+    time_stats, _ = profile_sizes_parallel(_fib, [5, 40], budget=1.5)
+    assert time.perf_counter() - start < 3
+    assert time_stats[0]["median"] is not None
+    assert time_stats[1].get("timed_out")
+
+def test_extra_sizes_stop_when_the_budget_runs_low(monkeypatch):
+    import complexity_core
+    monkeypatch.setattr(complexity_core, "TIMING_BUDGET", 3.0)
+    monkeypatch.setattr(complexity_core, "COMPLEXITY_MIN_CONFIDENCE", 1.01)
+    monkeypatch.setattr(complexity_core, "COMPLEXITY_EXTRA_SIZES", 10)
+    code = "def f(n):\n    s = 0\n    for i in range(n):\n        for j in range(n):\n            s += i ^ j\n    return s\n"
+    start = time.perf_counter()
+    result = complexity_core.analyze_code_job(code, "f", [10, 20, 40])
+    assert time.perf_counter() - start < 4
+    # Every fit stays ambiguous, so only the budget stops the extra sizes.
+    assert 4 <= len(result["input_sizes"]) < 13
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from sandbox import SandboxPool, SandboxTimeout
+from tracer_core import TraceBudget
+
+SWALLOWING = """
+for attempt in range(3):
+    try:
+        while True:
+            pass
+    except BaseException:
+        pass
+"""
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(workers=1, job_timeout=10)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+def test_program_that_swallows_the_budget_exception_is_stopped(pool):
+    started = time.monotonic()
+    result = asyncio.run(pool.submit("trace", SWALLOWING, budget=TraceBudget(max_steps=0, max_seconds=0.5)))
+    assert time.monotonic() - started < 5
+    assert result["trace"][-1]["event"]["type"] == "budget_exceeded"
+    assert result["trace"][-1]["event"]["limit"] == "max_seconds"
+    # The worker exited with the job; the next job gets a fresh one.
+    assert asyncio.run(pool.submit("trace", "x = 1\n"))["trace"][-1]["event"]["type"] == "execution_finished"
+
+def test_streamed_program_that_swallows_the_budget_exception_is_stopped(pool):
+    async def collect():
+        return [item async for item in pool.stream("trace_stream", SWALLOWING, budget=TraceBudget(max_steps=0, max_seconds=0.5))]
+    items = asyncio.run(collect())
+    assert items[-1][0] == "end"
+    assert [payload for kind, payload in items if kind == "item"][-1]["event"]["type"] == "budget_exceeded"
+
+def _pid(pool):
+    trace = asyncio.run(pool.submit("trace", "import os\npid = os.getpid()\n"))["trace"]
+    return trace[-1]["locals"]["pid"]["value"]
+
+def test_workers_are_replaced_after_max_jobs_per_worker():
+    pool = SandboxPool(workers=1, job_timeout=10, max_jobs_per_worker=2)
+    pool.start()
+    try:
+        pids = [_pid(pool) for _ in range(3)]
+        assert pids[0] == pids[1] != pids[2]
+        assert pool.metrics()["live_processes"] == 1
+    finally:
+        pool.shutdown()
+
+def test_job_over_the_timeout_kills_its_worker():
+    pool = SandboxPool(workers=1, job_timeout=1)
+    pool.start()
+    try:
+        before = _pid(pool)
+        started = time.monotonic()
+        with pytest.raises(SandboxTimeout):
+            asyncio.run(pool.submit("trace", "while True:\n    pass\n", budget=TraceBudget(max_steps=10 ** 9, max_seconds=60)))
+        assert time.monotonic() - started < 3
+        assert _pid(pool) != before
+        assert pool.metrics()["live_processes"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,39 @@
+import pytest
+
+from tracer_core import run_with_trace, trace_program
+
+CALL = "def f(k):\n    y = k * 2\n    return y\nx = f(3) + 1\n"
+
+def _trace(code, capture):
+    steps = []
+    trace_program(code, lambda step, frame_key: steps.append(step), capture=capture)
+    return steps
+
+def _line_step(steps, line, event_type):
+    return next(step for step in steps if step["line"] == line and step["event"]["type"] == event_type)
+
+@pytest.mark.parametrize("capture", ["eval", "execution"])
+def test_line_with_a_call_reports_the_result_and_the_callers_locals(capture):
+    step = _line_step(_trace(CALL, capture), 4, "binary_operation")
+    assert (step["event"]["left_val"], step["event"]["result_val"]) == (6, 7)
+    assert "k" not in step["locals"] and "y" not in step["locals"]
+
+def test_execution_capture_reports_values_after_the_line_ran():
+    code = "calls = []\ndef f():\n    calls.append(1)\n    return len(calls)\nx = f()\n"
+    step = _line_step(_trace(code, "execution"), 5, "assignment")
+    # Evaluated once, by the program: f() ran a single time.
+    assert step["event"]["value"]["value"] == 1
+    assert len(step["locals"]["calls"]["value"]) == 1
+
+@pytest.mark.parametrize("capture", ["eval", "execution"])
+def test_capture_hooks_are_not_visible_to_the_program(capture):
+    code = "def f():\n    return 1\nx = f() + 1\nnames = sorted(globals())\nlisted = dir()\n"
+    final = _trace(code, capture)[-1]["locals"]
+    assert [item["value"] for item in final["names"]["value"]] == ["__builtins__", "__name__", "f", "x"]
+    assert [item["value"] for item in final["listed"]["value"]] == ["__builtins__", "__name__", "f", "names", "x"]
+
+def test_capture_defaults_to_eval():
+    trace = run_with_trace("calls = []\ndef f():\n    calls.append(1)\n    return len(calls)\nx = f()\ndone = True\n")["trace"]
+    # Evaluating the line before it runs calls f() a second time.
+    assert _line_step(trace, 5, "assignment")["event"]["value"]["value"] == 1
+    assert trace[-1]["locals"]["x"]["value"] == 2
@@ -0,0 +1,32 @@
+import pytest
+
+from tracer_core import TraceScope, trace_program
+
+CODE = '''def algo(arr):
+    total = 0
+    # trace:start
+    for x in arr:
+        total += x
+    # trace:end
+    return total
+
+result = algo([1, 2, 3])
+'''
+
+def _trace(code, **kwargs):
+    steps = []
+    trace_program(code, lambda step, frame_key: steps.append(step), **kwargs)
+    return steps
+
+@pytest.mark.parametrize("backend", ["settrace", "auto"])
+def test_markers_inside_a_function(backend):
+    steps = _trace(CODE, backend=backend)
+    assert [step["line"] for step in steps[:-1]] == [4, 5] * 3
+    assert steps[-2]["locals"]["total"]["value"] == 6
+    assert steps[-1]["event"]["type"] == "execution_finished"
+
+@pytest.mark.parametrize("backend", ["settrace", "auto"])
+def test_line_range_inside_a_function(backend):
+    code = CODE.replace("    # trace:start\n", "").replace("    # trace:end\n", "")
+    steps = _trace(code, backend=backend, scope=TraceScope(lines=[(4, 4)]))
+    assert [step["event"]["type"] for step in steps] == ["binary_operation"] * 3 + ["execution_finished"]
@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import trace_sessions as sessions_module
+from routers import tracer_router
+from trace_sessions import TraceSessionNotFound, TraceSessionStore
+
+def _step(i):
+    return {"line": i, "locals": {"i": {"value": i}}}
+
+def _session(store, count):
+    session = store.new_session()
+    for i in range(count):
+        session.add_step(_step(i))
+    return session
+
+def _decoded(steps):
+    return [json.loads(step) for step in steps]
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(sessions_module, "TRACE_SESSION_CHUNK_STEPS", 4)
+
+@pytest.fixture
+def store(tmp_path):
+    return TraceSessionStore(ttl=60, directory=str(tmp_path))
+
+def test_window_is_clamped_to_the_session(store):
+    session = store.add(_session(store, 10), {"output": ""})
+    assert _decoded(store.window(session.id, 3, 9)[3]) == [_step(i) for i in range(3, 9)]
+    _, start, stop, steps = store.window(session.id, 8, 50)
+    assert (start, stop, _decoded(steps)) == (8, 10, [_step(8), _step(9)])
+    assert store.window(session.id, 20, 30)[3] == []
+
+def test_full_chunks_are_spilled_while_the_session_is_traced(store):
+    store.max_bytes = 0
+    session = _session(store, 10)
+    # Two full chunks went to disk before the session was added; the partial one is still in memory.
+    assert session.chunks[:2] == [None, None] and len(session.chunks[2]) == 2
+    assert len(os.listdir(session.directory)) == 2
+    store.add(session, {"output": ""})
+    assert _decoded(store.window(session.id, 0, 10)[3]) == [_step(i) for i in range(10)]
+    assert store.metrics()["spilled_chunks"] == 2
+
+def test_least_recently_used_session_is_spilled_and_read_back(store):
+    first = store.add(_session(store, 6), {"output": ""})
+    store.max_bytes = first.bytes
+    second = store.add(_session(store, 6), {"output": ""})
+    assert all(chunk is None for chunk in first.chunks) and second.bytes
+    assert _decoded(store.window(first.id, 0, 6)[3]) == [_step(i) for i in range(6)]
+    assert store.metrics()["memory_bytes"] == second.bytes
+
+def test_discarded_session_frees_its_memory_and_files(store):
+    store.max_bytes = 200
+    session = _session(store, 20)
+    assert session.directory and store.metrics()["memory_bytes"] > 0
+    store.discard(session)
+    assert store.metrics()["memory_bytes"] == 0
+    assert not os.path.exists(session.directory)
+
+def test_sessions_expire_after_their_ttl(store):
+    store.ttl = 0.05
+    store.max_bytes = 0
+    session = store.add(_session(store, 10), {"output": ""})
+    time.sleep(0.1)
+    with pytest.raises(TraceSessionNotFound):
+        store.window(session.id, 0, 1)
+    assert not os.path.exists(session.directory)
+    assert store.metrics()["expired"] == 1
+
+def test_seek_returns_one_step(store, monkeypatch):
+    monkeypatch.setattr(tracer_router, "trace_sessions", store)
+    app = FastAPI()
+    app.include_router(tracer_router.router)
+    client = TestClient(app)
+    session = store.add(_session(store, 10), {"output": ""})
+    response = client.get(f"/trace/{session.id}/steps/7")
+    assert response.json() == {"session_id": session.id, "index": 7, "step_count": 10, "step": _step(7)}
+    assert client.get(f"/trace/{session.id}/steps/10").status_code == 404
+    assert client.get("/trace/missing/steps/0").status_code == 404
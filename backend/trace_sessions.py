@@ -0,0 +1,224 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from json_encoding import encode_json
+
+# --- Configuration ---
+TRACE_SESSION_TTL = float(os.environ.get("TRACE_SESSION_TTL", 15 * 60))
+# Steps kept in memory across all sessions, including those still being traced;
+# beyond this, older sessions and the full chunks of new ones are spilled to disk.
+TRACE_SESSION_MAX_BYTES = int(os.environ.get("TRACE_SESSION_MAX_BYTES", 256 * 1024 * 1024))
+TRACE_SESSION_DIR = os.environ.get("TRACE_SESSION_DIR") or os.path.join(tempfile.gettempdir(), "codeviz-trace-sessions")
+TRACE_SESSION_CHUNK_STEPS = int(os.environ.get("TRACE_SESSION_CHUNK_STEPS", 500))
+TRACE_SESSION_MAX_WINDOW = int(os.environ.get("TRACE_SESSION_MAX_WINDOW", 1000))
+# Sessions exist for long programs, so they get a larger budget than /trace.
+TRACE_SESSION_MAX_STEPS = int(os.environ.get("TRACE_SESSION_MAX_STEPS", 500000))
+TRACE_SESSION_MAX_SECONDS = float(os.environ.get("TRACE_SESSION_MAX_SECONDS", 60))
+
+class TraceSessionNotFound(KeyError):
+    pass
+
+# --- Sessions ---
+# Steps are stored JSON-encoded, one bytes object per step, in chunks of
+# TRACE_SESSION_CHUNK_STEPS. A window response is then just the encoded steps
+# joined together. A spilled chunk is one zlib-compressed file of
+# newline-separated steps (encoded JSON never contains a raw newline).
+# While a session is being traced, each chunk is handed to its store as soon
+# as it is full, so a long trace is spilled as it grows rather than at the end.
+class TraceSession:
+    def __init__(self, session_id, store=None):
+        self.id = session_id
+        self.store = store
+        self.chunks = []          # list of step lists, or None once spilled
+        self.step_count = 0
+        self.bytes = 0            # held in memory
+        self.accounted = 0        # of those bytes, already counted by the store
+        self.summary = None       # output, call_tree, loop_context_map
+        self.last_access = time.monotonic()
+        self.directory = None
+
+    def add_step(self, step):
+        # The last chunk is None once it has been spilled, which only happens when it is full.
+        if not self.chunks or self.chunks[-1] is None or len(self.chunks[-1]) >= TRACE_SESSION_CHUNK_STEPS:
+            self.chunks.append([])
+        body = encode_json(step)
+        self.chunks[-1].append(body)
+        self.step_count += 1
+        self.bytes += len(body)
+        if self.store is not None and len(self.chunks[-1]) == TRACE_SESSION_CHUNK_STEPS:
+            self.store._chunk_full(self, len(self.chunks) - 1)
+
+    def spill(self, root):
+        for index, chunk in enumerate(self.chunks):
+            if chunk is not None:
+                self.spill_chunk(root, index)
+
+    def spill_chunk(self, root, index):
+        """Moves one chunk to disk and returns the bytes that freed."""
+        if self.directory is None:
+            self.directory = os.path.join(root, self.id)
+            os.makedirs(self.directory, exist_ok=True)
+        chunk = self.chunks[index]
+        with open(self._chunk_path(index), "wb") as f:
+            f.write(zlib.compress(b"\n".join(chunk)))
+        self.chunks[index] = None
+        freed = sum(map(len, chunk))
+        self.bytes -= freed
+        return freed
+
+    def chunk_range(self, start, stop):
+        """[(index, chunk or None if spilled)] for the chunks holding steps start..stop-1."""
+        size = TRACE_SESSION_CHUNK_STEPS
+        return [(index, self.chunks[index]) for index in range(start // size, (stop - 1) // size + 1)]
+
+    def steps(self, chunks, start, stop):
+        """Encoded steps start..stop-1 from the chunks chunk_range returned for them."""
+        result = []
+        size = TRACE_SESSION_CHUNK_STEPS
+        for index, chunk in chunks:
+            if chunk is None:
+                with open(self._chunk_path(index), "rb") as f:
+                    chunk = zlib.decompress(f.read()).split(b"\n")
+            offset = index * size
+            result.extend(chunk[max(start - offset, 0):stop - offset])
+        return result
+
+    def remove_files(self):
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _chunk_path(self, index):
+        return os.path.join(self.directory, f"{index}.ndjson.z")
+
+class TraceSessionStore:
+    """
+    Finished traces kept on the server so clients can fetch them a window at a
+    time. Sessions expire `ttl` seconds after their last access; when the steps
+    held in memory pass `max_bytes`, the full chunks of sessions still being
+    traced and then the least recently used sessions are moved to disk.
+    """
+
+    def __init__(self, ttl=TRACE_SESSION_TTL, max_bytes=TRACE_SESSION_MAX_BYTES, directory=TRACE_SESSION_DIR):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.spilled = 0
+        self.spilled_chunks = 0
+        self.expired = 0
+
+    def new_session(self):
+        """A session to fill with add_step and then either add or discard."""
+        return TraceSession(uuid.uuid4().hex, self)
+
+    def _chunk_full(self, session, index):
+        with self._lock:
+            size = sum(map(len, session.chunks[index]))
+            if self._bytes + size > self.max_bytes:
+                session.spill_chunk(self.directory, index)
+                self.spilled_chunks += 1
+            else:
+                self._bytes += size
+                session.accounted += size
+
+    def add(self, session, summary):
+        session.summary = summary
+        session.last_access = time.monotonic()
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            self._bytes += session.bytes - session.accounted
+            session.accounted = session.bytes
+            # Spilling happens under the lock so readers never see a half-spilled chunk list.
+            for candidate in list(self._sessions.values()):
+                if self._bytes <= self.max_bytes:
+                    break
+                if candidate.bytes:
+                    self._bytes -= candidate.bytes
+                    candidate.spill(self.directory)
+                    candidate.accounted = 0
+                    self.spilled += 1
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise TraceSessionNotFound(session_id)
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def window(self, session_id, start, stop):
+        """Encoded steps [start, stop) of a session, clamped to its length."""
+        session = self.get(session_id)
+        start = max(0, min(start, session.step_count))
+        stop = max(start, min(stop, session.step_count, start + TRACE_SESSION_MAX_WINDOW))
+        if stop <= start:
+            return session, start, stop, []
+        # Only the chunk list is read under the lock. A chunk taken from it stays
+        # valid if the session is spilled meanwhile, and spilled chunks are read
+        # from disk without holding up other sessions.
+        with self._lock:
+            chunks = session.chunk_range(start, stop)
+        try:
+            steps = session.steps(chunks, start, stop)
+        except FileNotFoundError:
+            # Removed or expired while its files were being read.
+            raise TraceSessionNotFound(session_id)
+        return session, start, stop, steps
+
+    def discard(self, session):
+        """Drops a session that was never added, e.g. because its trace failed."""
+        with self._lock:
+            self._bytes -= session.accounted
+            session.accounted = 0
+            session.remove_files()
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                raise TraceSessionNotFound(session_id)
+            self._drop(session)
+
+    def clear(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.remove_files()
+            self._sessions.clear()
+            self._bytes = 0
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_access > cutoff:
+                break
+            del self._sessions[session.id]
+            self._drop(session)
+            self.expired += 1
+
+    def _drop(self, session):
+        self._bytes -= session.bytes
+        session.remove_files()
+
+    def metrics(self):
+        return {
+            "sessions": len(self._sessions),
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "spilled": self.spilled,
+            "spilled_chunks": self.spilled_chunks,
+            "expired": self.expired,
+        }
+
+trace_sessions = TraceSessionStore()
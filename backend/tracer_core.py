@@ -396,13 +396,35 @@ import sys
 import io
 import copy
 import inspect
+import bisect
 import ast
+import builtins
+import collections
+import collections.abc
+import itertools
+import types
+import os
+import queue
+import re
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # memory budget is skipped without psutil
+    psutil = None
 
 # --- AST ANALYSIS (STATIC) ---
 class CodeAnalyzer(ast.NodeVisitor):
     def __init__(self):
         self.line_event_map = {}
         self.loop_context_map = {}
+        # The statement each line_event_map entry describes (instrumented in capture mode).
+        self.line_nodes = {}
+        # Loop header line -> last line of the loop body.
+        self.loop_ranges = {}
+        # for loop line -> _snapshot_plan, or None when the iterable is not re-evaluated.
+        self.loop_iterables = {}
 
     def visit_Assign(self, node):
         lineno = node.lineno
@@ -414,6 +436,7 @@ class CodeAnalyzer(ast.NodeVisitor):
                 "slice_str": ast.unparse(node.targets[0].slice).strip(),
                 "value_str": ast.unparse(node.value).strip(),
             }
+            self.line_nodes[lineno] = node
         elif isinstance(node.value, ast.BinOp):
             op_map = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Mod: '%', ast.Pow: '**', ast.LShift: '<<', ast.RShift: '>>', ast.BitOr: '|', ast.BitAnd: '&', ast.BitXor: '^', ast.FloorDiv: '//'}
             self.line_event_map[lineno] = {
@@ -424,12 +447,14 @@ class CodeAnalyzer(ast.NodeVisitor):
                 "op_str": op_map.get(type(node.value.op), '?'),
                 "result_variable": ast.unparse(node.targets[0]).strip()
             }
+            self.line_nodes[lineno] = node
         else:
             self.line_event_map[lineno] = {
                 "type": "assignment",
                 "target_var": ast.unparse(node.targets[0]).strip(),
                 "value_str": ast.unparse(node.value).strip(),
             }
+            self.line_nodes[lineno] = node
         self.generic_visit(node)
 
     def visit_AugAssign(self, node):
@@ -443,6 +468,7 @@ class CodeAnalyzer(ast.NodeVisitor):
             "op_str": op_map.get(type(node.op), '?'),
             "result_variable": ast.unparse(node.target).strip()
         }
+        self.line_nodes[lineno] = node
         self.generic_visit(node)
 
     def visit_Expr(self, node):
@@ -454,6 +480,7 @@ class CodeAnalyzer(ast.NodeVisitor):
                     "type": "print_event",
                     "arg_strs": [ast.unparse(arg).strip() for arg in call.args]
                 }
+                self.line_nodes[lineno] = node
             elif isinstance(call.func, ast.Attribute):
                 if call.func.attr in ['append', 'pop', 'insert', 'remove']:
                      self.line_event_map[lineno] = {
@@ -462,6 +489,7 @@ class CodeAnalyzer(ast.NodeVisitor):
                         "target_var": ast.unparse(call.func.value).strip(),
                         "arg_strs": [ast.unparse(arg).strip() for arg in call.args]
                     }
+                     self.line_nodes[lineno] = node
         self.generic_visit(node)
 
     def visit_Delete(self, node):
@@ -473,6 +501,7 @@ class CodeAnalyzer(ast.NodeVisitor):
                 "target_var": ast.unparse(node.targets[0].value).strip(),
                 "slice_str": ast.unparse(node.targets[0].slice).strip(),
             }
+            self.line_nodes[lineno] = node
         self.generic_visit(node)
 
     def visit_If(self, node):
@@ -480,6 +509,7 @@ class CodeAnalyzer(ast.NodeVisitor):
             "type": "condition_check",
             "condition_str": ast.unparse(node.test).strip()
         }
+        self.line_nodes[node.lineno] = node
         self.generic_visit(node)
         
     def visit_Return(self, node):
@@ -488,6 +518,7 @@ class CodeAnalyzer(ast.NodeVisitor):
                 "type": "return_statement",
                 "value_str": ast.unparse(node.value).strip()
             }
+            self.line_nodes[node.lineno] = node
         self.generic_visit(node)
 
     def visit_While(self, node):
@@ -495,6 +526,8 @@ class CodeAnalyzer(ast.NodeVisitor):
             "type": "condition_check",
             "condition_str": ast.unparse(node.test).strip()
         }
+        self.line_nodes[node.lineno] = node
+        self.loop_ranges[node.lineno] = max(item.end_lineno for item in node.body)
         for body_node in node.body:
             for i in range(body_node.lineno, getattr(body_node, 'end_lineno', body_node.lineno) + 1):
                 self.loop_context_map[i] = { "type": "while", "loop_line": node.lineno }
@@ -505,9 +538,12 @@ class CodeAnalyzer(ast.NodeVisitor):
         variable = getattr(node.target, 'id', 'loop_var')
         iterable = ast.unparse(node.iter).strip()
         self.line_event_map[loop_line] = { "type": "for_loop_start" }
+        self.line_nodes[loop_line] = node
         if node.body:
             start_line = node.body[0].lineno
             end_line = max(getattr(item, 'end_lineno', item.lineno) for item in node.body)
+            self.loop_ranges[loop_line] = end_line
+            self.loop_iterables[loop_line] = _snapshot_plan(node)
             for i in range(start_line, end_line + 1):
                 self.loop_context_map[i] = {
                     'type': 'for', 'loop_line': loop_line, 'variable': variable,
@@ -515,6 +551,132 @@ class CodeAnalyzer(ast.NodeVisitor):
                 }
         self.generic_visit(node)
 
+    def line_plans(self):
+        """
+        The expressions _enrich_event evaluates for each line, compiled once per
+        submission: {lineno: {"value": code, "args": [code, ...], ...}}.
+        """
+        plans = {}
+        for lineno, event in self.line_event_map.items():
+            plan = {}
+            for key, source_key in (("value", "value_str"), ("left", "left_str"), ("right", "right_str"),
+                                    ("condition", "condition_str"), ("target", "target_var"), ("slice", "slice_str")):
+                if source_key in event:
+                    plan[key] = _compile_expression(event[source_key])
+            if event["type"] == "binary_operation":
+                plan["result"] = _compile_expression(f"{event['left_str']} {event['op_str']} {event['right_str']}")
+            if "arg_strs" in event:
+                plan["args"] = [_compile_expression(arg) for arg in event["arg_strs"]]
+            plans[lineno] = plan
+        return plans
+
+def _compile_expression(source):
+    try:
+        return compile(source, '<string>', 'eval')
+    except SyntaxError:
+        # Evaluating the source string raises the same error at trace time.
+        return source
+
+# --- Value Capture ---
+# With capture="execution" (opt-in per request, or for every request with
+# TRACE_CAPTURE=execution) the values a step reports are taken
+# from the program's own execution instead of evaluating the expressions a
+# second time before the line runs. The submission is rewritten so those
+# expressions pass through hooks that store their value for the running frame:
+#
+#   x = f(a) + b   ->   x = __trace_capture__('result', __trace_capture__('left', f(a)) + __trace_capture__('right', b))
+#
+# The step is completed when its frame reaches its next line or returns, from
+# the captured values and the locals at that point. Statements without calls
+# are left alone: evaluating them before the line runs has no side effects and
+# gives the same values, and is cheaper than the hooks. The same goes for the
+# target reads around an augmented assignment. The default, "eval", evaluates
+# everything before the line runs. The hooks live in the program's builtins, so
+# globals() and dir() look the same in both modes.
+TRACE_CAPTURE = os.environ.get("TRACE_CAPTURE", "eval")
+CAPTURE_HOOK = '__trace_capture__'
+CAPTURE_BOOL_HOOK = '__trace_capture_bool__'
+CAPTURE_COPY_HOOK = '__trace_capture_copy__'
+# Frames of these only run expressions, never the statements a step describes.
+_EXPRESSION_SCOPES = {'<lambda>', '<listcomp>', '<setcomp>', '<dictcomp>', '<genexpr>'}
+_IMPURE_NODES = (ast.Call, ast.NamedExpr, ast.Await, ast.Yield, ast.YieldFrom, ast.Lambda,
+                 ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+def _is_pure(node):
+    return not any(isinstance(child, _IMPURE_NODES) for child in ast.walk(node))
+
+def _evaluated_parts(node):
+    # The expressions _enrich_event would evaluate for this statement.
+    if isinstance(node, ast.Assign):
+        return [node.value, node.targets[0]]
+    if isinstance(node, ast.AugAssign):
+        return [node.value, node.target]
+    if isinstance(node, ast.Expr):
+        call = node.value
+        return call.args + ([call.func.value] if isinstance(call.func, ast.Attribute) else [])
+    if isinstance(node, ast.Delete):
+        return node.targets
+    if isinstance(node, (ast.If, ast.While)):
+        return [node.test]
+    return []
+
+def _hook(name, key, expr):
+    call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[ast.Constant(value=key), expr], keywords=[])
+    return ast.copy_location(call, expr)
+
+class CaptureInstrumenter:
+    """
+    Adds capture hooks to the statements in analyzer.line_nodes, in place. Also
+    collects, per line, the last line of the code the step covers and the
+    target reads done around augmented assignments.
+    """
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.statement_end = {}
+        self.instrumented = set()
+        self.reads_before = {}
+        self.reads_after = {}
+
+    def instrument(self, tree):
+        for lineno, node in self.analyzer.line_nodes.items():
+            self.statement_end[lineno] = node.test.end_lineno if isinstance(node, (ast.If, ast.While)) else node.end_lineno
+            if all(_is_pure(part) for part in _evaluated_parts(node)):
+                continue
+            self.instrumented.add(lineno)
+            if isinstance(node, ast.Assign):
+                target = node.targets[0]
+                if isinstance(target, ast.Subscript):
+                    node.value = _hook(CAPTURE_HOOK, "value", node.value)
+                    self._subscript(target)
+                elif isinstance(node.value, ast.BinOp):
+                    node.value.left = _hook(CAPTURE_HOOK, "left", node.value.left)
+                    node.value.right = _hook(CAPTURE_HOOK, "right", node.value.right)
+                    node.value = _hook(CAPTURE_HOOK, "result", node.value)
+                else:
+                    node.value = _hook(CAPTURE_HOOK, "value", node.value)
+            elif isinstance(node, ast.AugAssign):
+                node.value = _hook(CAPTURE_HOOK, "right", node.value)
+                if _is_pure(node.target):
+                    read = _compile_expression(ast.unparse(node.target))
+                    self.reads_before[lineno] = {"left": read}
+                    self.reads_after[lineno] = {"result": read}
+            elif isinstance(node, ast.Expr):
+                call = node.value
+                if isinstance(call.func, ast.Attribute):
+                    call.func.value = _hook(CAPTURE_COPY_HOOK, "target", call.func.value)
+                call.args = [arg if isinstance(arg, ast.Starred) else _hook(CAPTURE_HOOK, f"arg{i}", arg) for i, arg in enumerate(call.args)]
+            elif isinstance(node, ast.Delete):
+                self._subscript(node.targets[0])
+            elif isinstance(node, (ast.If, ast.While)):
+                node.test = _hook(CAPTURE_BOOL_HOOK, "condition", node.test)
+        return ast.fix_missing_locations(tree)
+
+    def _subscript(self, target):
+        target.value = _hook(CAPTURE_COPY_HOOK, "target", target.value)
+        if not isinstance(target.slice, ast.Slice):
+            target.slice = _hook(CAPTURE_HOOK, "slice", target.slice)
+
 # --- Tracing Data Structures & Helpers ---
 class CallTreeNode:
     def __init__(self, name, args, step_index, parent_id=None):
@@ -528,55 +690,365 @@ class CallTreeNode:
         self.children = []
         self.return_value = None
 
-    def to_dict(self):
+    def _as_dict(self):
         return {
             "id": self.id, "parent_id": self.parent_id, "name": self.name,
             "args": self.args, "start_step": self.start_step, "end_step": self.end_step,
-            "children": [child.to_dict() for child in self.children],
+            "children": [],
             "return_value": self.return_value,
         }
 
+    def to_dict(self):
+        # Iterative so a runaway recursion stopped by the budget can still be returned.
+        root = self._as_dict()
+        pending = [(self, root)]
+        while pending:
+            node, node_dict = pending.pop()
+            for child in node.children:
+                child_dict = child._as_dict()
+                node_dict["children"].append(child_dict)
+                pending.append((child, child_dict))
+        return root
+
+# --- Value Serialization ---
+# Limits on what one ValueSerializer produces. Anything cut off is marked with
+# "truncated": true and, for strings and containers, the full "length".
+TRACE_VALUE_MAX_DEPTH = int(os.environ.get("TRACE_VALUE_MAX_DEPTH", 12))
+TRACE_VALUE_MAX_NODES = int(os.environ.get("TRACE_VALUE_MAX_NODES", 2000))
+TRACE_VALUE_MAX_STRING = int(os.environ.get("TRACE_VALUE_MAX_STRING", 1000))
+MAX_SEQUENCE_ITEMS = 50
+MAX_MAPPING_ITEMS = 25
+
+_PRIMITIVE_TYPES = (int, float, str, bool, type(None))
+_SEQUENCE_TYPES = ((list, "list"), (tuple, "tuple"), (set, "set"), (frozenset, "set"), (collections.deque, "deque"))
+# These have a __dict__ but their attributes are not program state.
+_OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+class ValueSerializer:
+    """
+    Serializes the values of one trace step within the size limits. Every
+    container or object is serialized once per serializer: a value reached again
+    through a shared reference reuses the first result, and a value reached from
+    inside itself becomes {"type": "ref", "id": ...}. With `retain`, every
+    value given an id is also stored there under it.
+    """
+
+    def __init__(self, max_depth=TRACE_VALUE_MAX_DEPTH, max_nodes=TRACE_VALUE_MAX_NODES, max_string=TRACE_VALUE_MAX_STRING, retain=None):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_string = max_string
+        self.retain = retain
+        self.nodes = 0
+        self._done = {}
+        self._active = set()
+
+    def serialize(self, v, depth=0):
+        self.nodes += 1
+        if isinstance(v, _PRIMITIVE_TYPES):
+            if isinstance(v, str) and len(v) > self.max_string:
+                return {"type": "primitive", "value": v[:self.max_string], "truncated": True, "length": len(v)}
+            return {"type": "primitive", "value": v}
+        key = id(v)
+        if key in self._done:
+            return self._done[key]
+        if key in self._active:
+            return {"type": "ref", "id": key}
+        if self.retain is not None:
+            self.retain[key] = v
+        self._active.add(key)
+        try:
+            result = self._serialize_object(v, key, depth)
+        finally:
+            self._active.discard(key)
+        self._done[key] = result
+        return result
+
+    def _serialize_object(self, v, key, depth):
+        expand = depth < self.max_depth and self.nodes < self.max_nodes
+        for container_type, kind in _SEQUENCE_TYPES:
+            if isinstance(v, container_type):
+                result = {"type": kind, "id": key, "value": []}
+                if expand:
+                    result["value"] = [self.serialize(item, depth + 1) for item in itertools.islice(v, MAX_SEQUENCE_ITEMS)]
+                return self._mark_truncated(result, len(v))
+        if isinstance(v, dict):
+            result = {"type": "dict", "id": key, "value": {}}
+            if expand:
+                result["value"] = {str(k): self.serialize(val, depth + 1) for k, val in itertools.islice(v.items(), MAX_MAPPING_ITEMS)}
+            return self._mark_truncated(result, len(v))
+        if type(v).__module__ == "numpy":
+            return self._serialize_numpy(v, key)
+        attributes = _object_attributes(v)
+        if attributes is None:
+            return {"type": "other", "value": self._repr(v)}
+        result = {"type": "object", "id": key, "class_name": v.__class__.__name__}
+        if attributes and expand:
+            result["attributes"] = {name: self.serialize(value, depth + 1) for name, value in attributes[:MAX_MAPPING_ITEMS]}
+        elif attributes:
+            result["truncated"] = True
+        return result
+
+    def _serialize_numpy(self, v, key):
+        shape = getattr(v, "shape", None)
+        if shape == ():
+            # Scalars (numpy.int64 and friends) and 0-d arrays.
+            item = v.item()
+            if isinstance(item, _PRIMITIVE_TYPES):
+                return {"type": "primitive", "value": item}
+        elif shape is not None and v.dtype.kind in "biuf":
+            # Numeric arrays are sent as plain nested lists of numbers.
+            window = v[tuple(slice(0, MAX_SEQUENCE_ITEMS) for _ in shape)]
+            self.nodes += window.size
+            result = {"type": "ndarray", "id": key, "dtype": str(v.dtype), "shape": list(shape), "value": window.tolist()}
+            if window.size < v.size:
+                result["truncated"] = True
+            return result
+        return {"type": "other", "value": self._repr(v)}
+
+    def _mark_truncated(self, result, length):
+        if len(result["value"]) < length:
+            result["truncated"] = True
+            result["length"] = length
+        return result
+
+    def _repr(self, v):
+        try:
+            text = repr(v)
+        except Exception:
+            return f"<{type(v).__name__} object>"
+        return text if len(text) <= self.max_string else text[:self.max_string] + "..."
+
+_MISSING = object()
+
+def _object_attributes(v):
+    # None when the value is not an object with attributes (it is then shown by
+    # repr), otherwise its public (name, value) pairs from __dict__ and __slots__.
+    has_dict = isinstance(getattr(v, "__dict__", None), dict)
+    if isinstance(v, _OPAQUE_TYPES):
+        return [] if hasattr(v, "__dict__") else None
+    attributes = [(name, value) for name, value in vars(v).items() if not name.startswith("__")] if has_dict else []
+    has_slots = False
+    for cls in type(v).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            has_slots = True
+            if name.startswith("__"):
+                continue
+            value = getattr(v, name, _MISSING)
+            if value is not _MISSING:
+                attributes.append((name, value))
+    if not has_dict and not has_slots:
+        return None
+    return attributes
+
 def serialize_value(v):
-    if isinstance(v, (int, float, str, bool, type(None))):
-        return {"type": "primitive", "value": v}
-    if isinstance(v, list):
-        return {"type": "list", "id": id(v), "value": [serialize_value(item) for item in v[:50]]}
-    if isinstance(v, dict):
-        return {"type": "dict", "id": id(v), "value": {str(k): serialize_value(val) for k, val in list(v.items())[:25]}}
-    if hasattr(v, '__dict__'):
-        return {"type": "object", "id": id(v), "class_name": v.__class__.__name__}
-    return {"type": "other", "value": repr(v)}
-
-def _enrich_event(static_event, frame):
-    event = copy.deepcopy(static_event)
+    return ValueSerializer().serialize(v)
+
+def serialize_locals(scope, retain=None):
+    """A frame's variables, serialized together so values they share are serialized once."""
+    serializer = ValueSerializer(retain=retain)
+    return {k: serializer.serialize(v) for k, v in scope.items() if not k.startswith('__')}
+
+# --- Loop Snapshots ---
+# A for loop's iterable is evaluated and serialized once per run of the loop; its
+# iteration steps then carry only "index" and "snapshot_step" (the index of the
+# step holding "iterable_snapshot"). The snapshot is taken again when the objects
+# the loop reads from change size, are the target of an array operation in the
+# loop's frame, or no longer hold the loop value at the current index. Iterables
+# whose evaluation could have side effects (calls other than the builtins below,
+# iterators that would be consumed) get no snapshot at all.
+TRACE_LOOP_SNAPSHOT_ITEMS = int(os.environ.get("TRACE_LOOP_SNAPSHOT_ITEMS", 1000))
+# Builtins that read their arguments lazily (the loop sees later changes to them)
+# and ones that copy them up front.
+_LAZY_BUILTINS = {"range", "enumerate", "zip", "reversed"}
+_COPYING_BUILTINS = {"sorted", "list", "tuple", "set"}
+_VIEW_METHODS = {"items", "keys", "values"}
+# Builtins that only read their arguments, so the iterable may call them (for
+# range(len(arr))) as long as their names still refer to the builtins.
+_PURE_BUILTINS = {"len", "abs", "round", "int", "float", "ord", "chr"}
+# Iterables whose length is the number of items they yield.
+_SIZED_TYPES = (list, tuple, str, bytes, dict, set, frozenset, range)
+
+def _exits_early(loop):
+    """Whether the loop's body can leave it with a break or return."""
+    pending = [(node, True) for node in loop.body]
+    while pending:
+        node, breaks_out = pending.pop()
+        if isinstance(node, ast.Return) or (breaks_out and isinstance(node, ast.Break)):
+            return True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        inner = breaks_out and not isinstance(node, (ast.For, ast.AsyncFor, ast.While))
+        pending.extend((child, inner) for child in ast.iter_child_nodes(node))
+    return False
+
+def _pure_builtin_calls(node):
+    """The _PURE_BUILTINS calls in `node` if nothing else in it is impure, otherwise None."""
+    calls = []
+    for child in ast.walk(node):
+        if (isinstance(child, ast.Call) and isinstance(child.func, ast.Name) and child.func.id in _PURE_BUILTINS
+                and not child.keywords and not any(isinstance(arg, ast.Starred) for arg in child.args)):
+            calls.append(child)
+        elif isinstance(child, _IMPURE_NODES):
+            return None
+    return calls
+
+def _snapshot_plan(loop):
+    """How to evaluate a for loop's iterable ahead of the program, or None if that is not safe."""
+    node = loop.iter
+    # "calls": builtin names the iterable calls, checked before every evaluation.
+    plan = {"iterable": _compile_expression(ast.unparse(node)), "builtin": None, "sources": [], "calls": set(),
+            "simple_target": isinstance(loop.target, ast.Name), "exits_early": _exits_early(loop)}
+    if not isinstance(node, ast.Call):
+        calls = _pure_builtin_calls(node)
+        if calls is None:
+            return None
+        plan["calls"] = {call.func.id for call in calls}
+        plan["sources"] = [ast.unparse(node)] + [ast.unparse(arg) for call in calls for arg in call.args]
+        return plan
+    if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+        return None
+    calls = [_pure_builtin_calls(arg) for arg in node.args]
+    if None in calls:
+        return None
+    calls = [call for arg_calls in calls for call in arg_calls]
+    plan["calls"] = {call.func.id for call in calls}
+    func = node.func
+    if isinstance(func, ast.Name) and func.id in _LAZY_BUILTINS | _COPYING_BUILTINS:
+        plan["builtin"] = func.id
+        plan["args"] = [_compile_expression(ast.unparse(arg)) for arg in node.args]
+        if func.id in _LAZY_BUILTINS:
+            # The objects passed to len() etc. are read too: range(len(arr)) changes with arr.
+            plan["sources"] = [ast.unparse(arg) for arg in node.args] + [ast.unparse(arg) for call in calls for arg in call.args]
+        return plan
+    if calls:
+        return None
+    if isinstance(func, ast.Attribute) and func.attr in _VIEW_METHODS and not node.args and _is_pure(func.value):
+        plan["receiver"] = _compile_expression(ast.unparse(func.value))
+        plan["sources"] = [ast.unparse(func.value)]
+        return plan
+    return None
+
+class _LoopRun:
+    """One run of a for loop in one frame, from entering it to leaving it."""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.armed = True         # the header ran since the last iteration step
+        self.index = -1
+        self.snapshot_step = None
+        self.watched = []         # (object, its length when the snapshot was taken)
+        self.iterable = None
+        self.dirty = plan is not None
+
+    def take_snapshot(self, frame):
+        """The serialized snapshot, or None when the iterable must not be evaluated."""
+        self.dirty = False
+        g, l = frame.f_globals, frame.f_locals
+        plan = self.plan
+        # len(arr) and the like ran once, when the loop started: after arr changes,
+        # evaluating the iterable again would not give what the loop iterates.
+        if plan["calls"] and self.snapshot_step is not None:
+            return None
+        try:
+            if not self._builtins_intact(g, l):
+                return None
+            if plan["builtin"] is not None:
+                if eval(plan["builtin"], g, l) is not getattr(builtins, plan["builtin"]):
+                    return None
+                args = [eval(arg, g, l) for arg in plan["args"]]
+                if any(isinstance(arg, collections.abc.Iterator) for arg in args):
+                    return None
+                watched = args if plan["builtin"] in _LAZY_BUILTINS else []
+            elif "receiver" in plan:
+                receiver = eval(plan["receiver"], g, l)
+                if not isinstance(receiver, dict):
+                    return None
+                watched = [receiver]
+            else:
+                watched = []
+            iterable = eval(plan["iterable"], g, l)
+            if isinstance(iterable, collections.abc.Iterator) and plan["builtin"] is None and "receiver" not in plan:
+                return None
+            if not watched and plan["builtin"] is None:
+                watched = [iterable]
+            serializer = ValueSerializer()
+            items = [serializer.serialize(item) for item in itertools.islice(iterable, TRACE_LOOP_SNAPSHOT_ITEMS)]
+        except Exception:
+            return None
+        self.watched = [(obj, len(obj)) for obj in watched if isinstance(obj, collections.abc.Sized)]
+        self.iterable = iterable if isinstance(iterable, list) and plan["simple_target"] else None
+        return items
+
+    def length(self, frame):
+        """How many times the loop will run, or None when that is not known up front."""
+        plan = self.plan
+        g, l = frame.f_globals, frame.f_locals
+        try:
+            if not self._builtins_intact(g, l):
+                return None
+            if plan["builtin"] is not None:
+                if eval(plan["builtin"], g, l) is not getattr(builtins, plan["builtin"]):
+                    return None
+                args = [eval(arg, g, l) for arg in plan["args"]]
+                if plan["builtin"] == "range":
+                    return len(range(*args))
+                if plan["builtin"] == "zip":
+                    return min(len(arg) for arg in args) if args and all(isinstance(arg, _SIZED_TYPES) for arg in args) else None
+                if plan["builtin"] == "set":
+                    return None
+                iterable = args[0] if args else None
+            elif "receiver" in plan:
+                iterable = eval(plan["receiver"], g, l)
+            else:
+                iterable = eval(plan["iterable"], g, l)
+        except Exception:
+            return None
+        return len(iterable) if isinstance(iterable, _SIZED_TYPES) else None
+
+    def _builtins_intact(self, g, l):
+        return all(eval(name, g, l) is getattr(builtins, name) for name in self.plan["calls"])
+
+    def changed(self, current_value):
+        if self.dirty:
+            return True
+        if any(len(obj) != length for obj, length in self.watched):
+            return True
+        # An in-place write at the current position (possibly through an alias).
+        iterable = self.iterable
+        return iterable is not None and (self.index >= len(iterable) or iterable[self.index] is not current_value)
+
+def _enrich_event(static_event, plan, frame):
+    # Only new top-level keys are added, so a shallow copy keeps static_event intact.
+    event = dict(static_event)
     g, l = frame.f_globals, frame.f_locals
     try:
         if event["type"] in ["assignment", "return_statement"]:
-            raw_value = eval(event["value_str"], g, l)
+            raw_value = eval(plan["value"], g, l)
             event["value"] = serialize_value(raw_value)
 
         elif event["type"] == "binary_operation":
-            event["left_val"] = eval(event["left_str"], g, l)
-            event["right_val"] = eval(event["right_str"], g, l)
-            event["result_val"] = eval(f"{event['left_str']} {event['op_str']} {event['right_str']}", g, l)
+            event["left_val"] = eval(plan["left"], g, l)
+            event["right_val"] = eval(plan["right"], g, l)
+            event["result_val"] = eval(plan["result"], g, l)
             
             event["operands"] = {}
             left_s = event["left_str"]
             right_s = event["right_str"]
             try:
                 if left_s.isidentifier() and (left_s in l or left_s in g):
-                    event["operands"][left_s] = eval(left_s, g, l)
+                    event["operands"][left_s] = eval(plan["left"], g, l)
                 if right_s.isidentifier() and (right_s in l or right_s in g):
-                    event["operands"][right_s] = eval(right_s, g, l)
+                    event["operands"][right_s] = eval(plan["right"], g, l)
             except: pass
 
         elif event["type"] == "condition_check":
-            event["result"] = bool(eval(event["condition_str"], g, l))
+            event["result"] = bool(eval(plan["condition"], g, l))
             
         elif event["type"] == "print_event":
             try:
                 arg_strs = event["arg_strs"]
-                evaluated_args = [eval(s, g, l) for s in arg_strs]
+                evaluated_args = [eval(code, g, l) for code in plan["args"]]
                 final_output_string = " ".join(map(str, evaluated_args))
                 event["output"] = serialize_value(final_output_string)
                 event["arguments"] = []
@@ -589,14 +1061,14 @@ def _enrich_event(static_event, frame):
                 event["output"] = serialize_value(f"Error evaluating print: {e}")
 
         elif event["type"] == "array_operation":
-            target_obj = eval(event["target_var"], g, l)
+            target_obj = eval(plan["target"], g, l)
             event["list_snapshot_before"] = copy.copy(target_obj)
             if event["method"] in ["assign_at_index", "delete_by_index"]:
-                event["index"] = eval(event["slice_str"], g, l)
+                event["index"] = eval(plan["slice"], g, l)
             if event["method"] == "assign_at_index":
-                event["value"] = eval(event["value_str"], g, l)
+                event["value"] = eval(plan["value"], g, l)
             if "arg_strs" in event:
-                event["args"] = [eval(arg, g, l) for arg in event["arg_strs"]]
+                event["args"] = [eval(code, g, l) for code in plan["args"]]
             if event["method"] == "pop" and isinstance(target_obj, list):
                 if event["args"]: event["index"] = event["args"][0]
                 else: event["index"] = len(target_obj) - 1
@@ -607,50 +1079,1002 @@ def _enrich_event(static_event, frame):
         event["eval_error"] = True
     return event
 
+def _fill_captured_event(static_event, values, g, l):
+    # Capture-mode counterpart of _enrich_event. A value missing from `values`
+    # means the line raised before producing it.
+    event = dict(static_event)
+    try:
+        if event["type"] == "assignment":
+            event["value"] = serialize_value(values["value"])
+
+        elif event["type"] == "binary_operation":
+            event["left_val"] = values["left"]
+            event["right_val"] = values["right"]
+            event["result_val"] = values["result"]
+            event["operands"] = {}
+            for side in ("left", "right"):
+                name = event[f"{side}_str"]
+                if name.isidentifier() and (name in l or name in g):
+                    event["operands"][name] = values[side]
+
+        elif event["type"] == "condition_check":
+            event["result"] = values["condition"]
+
+        elif event["type"] == "print_event":
+            arg_strs = event["arg_strs"]
+            if all(f"arg{i}" in values for i in range(len(arg_strs))):
+                evaluated_args = [values[f"arg{i}"] for i in range(len(arg_strs))]
+                event["output"] = serialize_value(" ".join(map(str, evaluated_args)))
+                event["arguments"] = [{"str": original_string, "value": serialize_value(value)} for original_string, value in zip(arg_strs, evaluated_args)]
+            else:
+                event["arguments"] = []
+                event["output"] = serialize_value("Error evaluating print: the line raised an exception")
+
+        elif event["type"] == "array_operation":
+            snapshot = values["target"]
+            event["list_snapshot_before"] = snapshot
+            if event["method"] in ["assign_at_index", "delete_by_index"]:
+                event["index"] = values["slice"]
+            if event["method"] == "assign_at_index":
+                event["value"] = values["value"]
+            if "arg_strs" in event:
+                event["args"] = [values[f"arg{i}"] for i in range(len(event["arg_strs"]))]
+            if event["method"] == "pop" and isinstance(snapshot, list):
+                if event["args"]: event["index"] = event["args"][0]
+                else: event["index"] = len(snapshot) - 1
+                event["removed_value"] = snapshot[event["index"]]
+            if event["method"] == "remove" and isinstance(snapshot, list):
+                event["removed_index"] = snapshot.index(event["args"][0])
+    except Exception:
+        event["eval_error"] = True
+    return event
+
+# --- Delta Trace Encoding ---
+# Compact trace format, selected with run_with_trace(code, trace_format="delta").
+# The response carries "trace_format": "delta" and "keyframe_interval", and every
+# step in "trace" is one of:
+#
+#   keyframe: {"line", "event", "locals": {...}}
+#       "locals" is the complete, serialized set of variables of the step.
+#   delta:    {"line", "event", "base": <index>, "set": {...}, "unset": [...], "patch": {...}}
+#       Start from the locals of step `base` (always an earlier step of the same
+#       stack frame), drop the names in "unset", apply "set" and then "patch".
+#       Each key is omitted when empty.
+#
+# "patch" holds the variables whose list or dict (same object, same other
+# fields) changed in only a few items, instead of resending the container:
+#   list: {"len": <new length>, "items": [[<index>, <item>], ...]}
+#   dict: {"set": {<key>: <item>}, "unset": [<key>, ...]}
+#
+# A step whose stack differs from the previous step's carries either "stack"
+# (the whole stack) or "stack_keep": <n> and "stack_push": [...] (keep the
+# first n frames of the previous stack, then push these; "stack_push" omitted
+# when empty). A step with none of them shares the stack of the step before.
+# The whole stack is resent every `keyframe_interval` stack changes.
+# A frame's delta chain never grows past `keyframe_interval` steps, so any
+# single step can be rebuilt by walking at most that many `base` links (see
+# materialize_delta_step).
+#
+# The steps' "event" fields are the same in both formats, so they bound the
+# saving: a delta trace is about 3-6x smaller than the full one for loops over
+# lists and dicts, but only about 1.5x for recursion over a few small locals,
+# where the events make up most of the trace.
+DELTA_KEYFRAME_INTERVAL = 50
+
+class DeltaTraceEncoder:
+    def __init__(self, keyframe_interval=DELTA_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        # frame key -> (index of the frame's last step, its locals, delta chain length)
+        self.frames = {}
+        self.prev_stack = None
+        self.stack_changes = 0
+        self.count = 0
+
+    def encode(self, step, frame_key):
+        compact = {"line": step["line"], "event": step["event"]}
+        stack = step.get("stack", [])
+        if stack != self.prev_stack:
+            keep = _common_prefix(self.prev_stack or [], stack)
+            if keep and self.stack_changes < self.keyframe_interval:
+                compact["stack_keep"] = keep
+                if stack[keep:]: compact["stack_push"] = stack[keep:]
+                self.stack_changes += 1
+            else:
+                compact["stack"] = stack
+                self.stack_changes = 0
+            self.prev_stack = stack
+
+        step_locals = step.get("locals", {})
+        previous = self.frames.get(frame_key)
+        if previous is None or previous[2] >= self.keyframe_interval:
+            compact["locals"] = step_locals
+            chain = 0
+        else:
+            base_index, base_locals, chain = previous
+            changed, patched = {}, {}
+            for k, v in step_locals.items():
+                if base_locals.get(k) != v:
+                    patch = _value_patch(base_locals.get(k), v)
+                    if patch is None:
+                        changed[k] = v
+                    else:
+                        patched[k] = patch
+            removed = [k for k in base_locals if k not in step_locals]
+            compact["base"] = base_index
+            if changed: compact["set"] = changed
+            if removed: compact["unset"] = removed
+            if patched: compact["patch"] = patched
+            chain += 1
+
+        self.frames[frame_key] = (self.count, step_locals, chain)
+        self.count += 1
+        return compact
+
+    def forget(self, frame_key):
+        # Frame ids get reused once a frame is freed, so drop the state on return.
+        self.frames.pop(frame_key, None)
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+def _value_patch(old, new):
+    """
+    An item-level patch turning serialized container `old` into `new`, or None
+    when they are not the same list or dict or when most of it changed.
+    """
+    if not isinstance(old, dict) or old.keys() != new.keys() or any(old[k] != new[k] for k in new if k != "value"):
+        return None
+    before, after = old["value"], new["value"]
+    if isinstance(before, list) and isinstance(after, list):
+        items = [[i, item] for i, item in enumerate(after) if i >= len(before) or before[i] != item]
+        patch, changes = {"len": len(after), "items": items}, len(items)
+    elif isinstance(before, dict) and isinstance(after, dict):
+        patch = {}
+        changed = {k: v for k, v in after.items() if k not in before or before[k] != v}
+        removed = [k for k in before if k not in after]
+        if changed: patch["set"] = changed
+        if removed: patch["unset"] = removed
+        changes = len(changed) + len(removed)
+    else:
+        return None
+    return patch if changes * 2 <= len(after) else None
+
+def _apply_value_patch(old, patch):
+    value = dict(old)
+    if "len" in patch:
+        items = old["value"][:patch["len"]]
+        items += [None] * (patch["len"] - len(items))
+        for i, item in patch["items"]:
+            items[i] = item
+    else:
+        items = dict(old["value"])
+        for k in patch.get("unset", []):
+            items.pop(k, None)
+        items.update(patch.get("set", {}))
+    value["value"] = items
+    return value
+
+def _delta_locals(steps, index, cache):
+    if index in cache:
+        return cache[index]
+    step = steps[index]
+    if "locals" in step:
+        return step["locals"]
+    step_locals = dict(_delta_locals(steps, step["base"], cache))
+    for name in step.get("unset", []):
+        step_locals.pop(name, None)
+    step_locals.update(step.get("set", {}))
+    for name, patch in step.get("patch", {}).items():
+        step_locals[name] = _apply_value_patch(step_locals[name], patch)
+    return step_locals
+
+def _next_stack(stack, step):
+    if "stack" in step:
+        return step["stack"]
+    if "stack_keep" in step:
+        return stack[:step["stack_keep"]] + step.get("stack_push", [])
+    return stack
+
+def _delta_stack(steps, index):
+    start = index
+    while start > 0 and "stack" not in steps[start]:
+        start -= 1
+    stack = []
+    for step in steps[start:index + 1]:
+        stack = _next_stack(stack, step)
+    return stack
+
+def materialize_delta_step(steps, index):
+    """Rebuilds step `index` of a delta-encoded trace into the full step format."""
+    step = steps[index]
+    return {
+        "line": step["line"], "event": step["event"],
+        "locals": _delta_locals(steps, index, {}),
+        "stack": _delta_stack(steps, index),
+    }
+
+def expand_delta_trace(steps):
+    """Rebuilds every step of a delta-encoded trace, in order."""
+    expanded = []
+    cache = {}
+    stack = []
+    for index, step in enumerate(steps):
+        stack = _next_stack(stack, step)
+        cache[index] = _delta_locals(steps, index, cache)
+        expanded.append({"line": step["line"], "event": step["event"], "locals": cache[index], "stack": stack})
+    return expanded
+
+# --- Heap Trace Encoding ---
+# Opt-in with run_with_trace(code, heap=True); composes with either trace format.
+# Lists, dicts, tuples, sets, deques, arrays and objects are moved out of the
+# step locals into one table, returned as result["heap"]:
+#
+#   {"<id>": [{"version": 0, "step": <index>, "type": "list", "value": [...]},
+#             {"version": 1, "step": <index>, ...}, ...]}
+#
+# In step locals such a value is {"type": "ref", "id", "version"}. An object only
+# gets a new version when its own contents differ from its previous version.
+# Inside the table, a nested container or object is {"type": "ref", "id"} and
+# means the version of that object in effect at the step being shown: its last
+# version whose "step" is <= that step. Event payloads are left as they are.
+#
+# Ids are id()s, which CPython hands out again once an object is freed, so a
+# heap trace keeps every object it serialized alive until the trace ends
+# (trace_program's keep_alive). A value the serializer cut off at its depth or
+# node limit is not a new version: it refers to the object's latest one.
+_HEAP_SEQUENCES = {"list", "tuple", "set", "deque"}
+
+def _cut_short(value):
+    # Truncated for running out of depth or nodes, as opposed to showing only
+    # the first MAX_SEQUENCE_ITEMS items.
+    if not value.get("truncated"):
+        return False
+    return "attributes" not in value if value["type"] == "object" else not value.get("value")
+
+class HeapTraceEncoder:
+    def __init__(self):
+        self.heap = {}
+        self.count = 0
+        # id -> contents of its latest version, to tell whether it changed
+        self._latest = {}
+
+    def encode(self, step):
+        seen = {}
+        compact = dict(step)
+        compact["locals"] = {name: self._ref(value, seen) for name, value in step.get("locals", {}).items()}
+        self.count += 1
+        return compact
+
+    def _ref(self, value, seen):
+        if "id" not in value or value["type"] == "ref":
+            return value
+        key = str(value["id"])
+        if key not in seen and key in self._latest and _cut_short(value):
+            seen[key] = len(self.heap[key]) - 1
+        if key not in seen:
+            seen[key] = None
+            entry = {k: v for k, v in value.items() if k not in ("id", "value", "attributes")}
+            if value["type"] in _HEAP_SEQUENCES:
+                entry["value"] = [self._nested(item, seen) for item in value["value"]]
+            elif value["type"] == "dict":
+                entry["value"] = {k: self._nested(v, seen) for k, v in value["value"].items()}
+            elif "value" in value:
+                entry["value"] = value["value"]
+            if "attributes" in value:
+                entry["attributes"] = {k: self._nested(v, seen) for k, v in value["attributes"].items()}
+            seen[key] = self._version(key, entry)
+        return {"type": "ref", "id": value["id"], "version": seen[key]}
+
+    def _nested(self, value, seen):
+        ref = self._ref(value, seen)
+        return {"type": "ref", "id": ref["id"]} if ref["type"] == "ref" else ref
+
+    def _version(self, key, entry):
+        versions = self.heap.setdefault(key, [])
+        if self._latest.get(key) != entry:
+            self._latest[key] = entry
+            versions.append({"version": len(versions), "step": self.count, **entry})
+        return len(versions) - 1
+
+# --- Execution Budget ---
+TRACE_MAX_STEPS = int(os.environ.get("TRACE_MAX_STEPS", 20000))
+TRACE_MAX_SECONDS = float(os.environ.get("TRACE_MAX_SECONDS", 5))
+TRACE_MAX_MEMORY_MB = float(os.environ.get("TRACE_MAX_MEMORY_MB", 1024))
+# RSS is sampled every N tracer events, reading it on every line is too slow.
+MEMORY_CHECK_INTERVAL = 1000
+
+# BaseException so that a user's `except Exception:` cannot swallow it.
+class TraceBudgetExceeded(BaseException):
+    def __init__(self, limit, value, message):
+        super().__init__(message)
+        self.limit = limit
+        self.value = value
+        self.message = message
+
+class TraceBudget:
+    def __init__(self, max_steps=TRACE_MAX_STEPS, max_seconds=TRACE_MAX_SECONDS, max_memory_mb=TRACE_MAX_MEMORY_MB):
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.max_memory_mb = max_memory_mb
+        self.deadline = None
+        self.events = 0
+        self.process = None
+        # The first limit hit; every later check raises it again.
+        self.exceeded = None
+
+    def start(self):
+        # Created here rather than in __init__ so budgets can be sent to a sandbox worker.
+        self.process = psutil.Process() if psutil and self.max_memory_mb else None
+        self.deadline = time.perf_counter() + self.max_seconds if self.max_seconds else None
+        self.events = 0
+        self.exceeded = None
+
+    def check(self, step_count):
+        """Raises TraceBudgetExceeded once any limit is hit; called on every tracer event."""
+        self.events += 1
+        if self.exceeded is not None:
+            e = self.exceeded
+            raise TraceBudgetExceeded(e.limit, e.value, e.message)
+        if self.max_steps and step_count >= self.max_steps:
+            raise self.trip(TraceBudgetExceeded("max_steps", self.max_steps, f"Trace stopped after {self.max_steps} steps."))
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise self.trip(self._timeout())
+        if self.process and self.events % MEMORY_CHECK_INTERVAL == 0 and self._over_memory():
+            raise self.trip(self._out_of_memory())
+
+    def trip(self, exceeded):
+        if self.exceeded is None:
+            self.exceeded = exceeded
+        return exceeded
+
+    def overrun(self):
+        """The limit that was hit, also noticing time and memory limits passed while no tracer event ran."""
+        if self.exceeded is None and self.deadline is not None and time.perf_counter() > self.deadline:
+            self.trip(self._timeout())
+        if self.exceeded is None and self.process and self._over_memory():
+            self.trip(self._out_of_memory())
+        return self.exceeded
+
+    def _over_memory(self):
+        return self.process.memory_info().rss / (1024 * 1024) > self.max_memory_mb
+
+    def _timeout(self):
+        return TraceBudgetExceeded("max_seconds", self.max_seconds, f"Execution took longer than {self.max_seconds} seconds.")
+
+    def _out_of_memory(self):
+        return TraceBudgetExceeded("max_memory_mb", self.max_memory_mb, f"Memory use exceeded {self.max_memory_mb} MB.")
+
+# The budget is enforced from the tracer's event hook, which raises again on
+# every event once a limit is hit. Under settrace, though, an exception raised
+# from the hook also switches tracing off for the thread, so a program that
+# swallows it (`except BaseException: pass` around a loop) keeps running with
+# no events at all. The backstop covers that case: when the budget has been
+# spent for TRACE_BACKSTOP_GRACE seconds and the program is still running, it
+# finishes the trace on its own thread and hands the result to `on_stuck`. The
+# sandbox worker sends that result and exits (see sandbox.STUCK_JOBS); outside
+# a sandbox there is no backstop.
+TRACE_BACKSTOP_INTERVAL = 0.1
+TRACE_BACKSTOP_GRACE = float(os.environ.get("TRACE_BACKSTOP_GRACE", 1))
+
+class _Backstop:
+    def __init__(self, budget, on_stuck):
+        self.budget = budget
+        self.on_stuck = on_stuck
+        self.stopped = threading.Event()
+        threading.Thread(target=self._watch, name="trace-backstop", daemon=True).start()
+
+    def _watch(self):
+        spent_since = None
+        while not self.stopped.wait(TRACE_BACKSTOP_INTERVAL):
+            if self.budget.overrun() is None:
+                continue
+            spent_since = spent_since or time.monotonic()
+            if time.monotonic() - spent_since >= TRACE_BACKSTOP_GRACE:
+                self.on_stuck()
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+# --- Tracing Scope ---
+# A scope limits tracing to part of a program. A frame is traced when its
+# function is one of `functions`, or when it was called from traced code. Lines
+# in `lines` (inclusive ranges) are traced in any frame: a frame whose code
+# spans part of a range keeps its events on, and only its lines inside the
+# range produce steps. Everything else runs without steps; under sys.monitoring
+# its events are switched off entirely. `# trace:start` / `# trace:end`
+# comments in the source add a line range.
+_MARKER = re.compile(r"#\s*trace:(start|end)\b")
+
+class TraceScope:
+    def __init__(self, functions=(), lines=()):
+        self.functions = frozenset(functions)
+        self.lines = sorted((start, end) for start, end in lines)
+
+    def __bool__(self):
+        return bool(self.functions or self.lines)
+
+    def covers(self, lineno):
+        index = bisect.bisect_right(self.lines, (lineno, float('inf'))) - 1
+        return any(start <= lineno <= end for start, end in self.lines[:index + 1])
+
+    def overlaps(self, first, last):
+        return any(start <= last and first <= end for start, end in self.lines)
+
+    @classmethod
+    def resolve(cls, scope, code_str):
+        """`scope` plus the ranges marked in the source; None when nothing is selected."""
+        marked = _marked_ranges(code_str)
+        if marked:
+            scope = cls(scope.functions if scope else (), (scope.lines if scope else []) + marked)
+        return scope or None
+
+def _marked_ranges(code_str):
+    ranges = []
+    start = None
+    lines = code_str.splitlines()
+    for lineno, text in enumerate(lines, 1):
+        match = _MARKER.search(text)
+        if not match or not text.strip().startswith("#"):
+            continue
+        if match.group(1) == "start" and start is None:
+            start = lineno
+        elif match.group(1) == "end" and start is not None:
+            ranges.append((start, lineno))
+            start = None
+    if start is not None:
+        ranges.append((start, len(lines)))
+    return ranges
+
+# --- Loop Summarization ---
+# Opt-in with trace_program(..., loop_keep=K). The first K and the last K
+# iterations of every loop are traced in full. The iterations in between are
+# replaced by one step, emitted when the loop ends, just before the last K:
+#
+#   {"type": "loop_summary", "loop_line": <header line>,
+#    "first_iteration": K + 1, "last_iteration": <n>, "iterations": <count>,
+#    "steps": <steps left out>,
+#    "variables": {name: {"final": <serialized>, "min": <number>, "max": <number>}}}
+#
+# "variables" covers the loop's own frame; min/max only appear for numbers.
+# Loop iteration steps carry no iterable snapshot in this mode, so the iterable
+# is never materialized. A loop nested in a kept iteration is summarized on its
+# own; one nested in a left-out iteration is part of the outer summary.
+#
+# When a for loop's length is known on entry (expect()), the iterations to leave
+# out are known too: their steps are only counted (skip()) and never built or
+# serialized. Other loops keep their last K + 1 iterations in full until they
+# can tell which ones to leave out.
+class LoopSummarizer:
+    def __init__(self, keep, loop_ranges, sink, absorb, snapshot):
+        self.keep = keep
+        self.loop_ranges = loop_ranges
+        self.sink = sink
+        # absorb(step, summary_step): `step` was left out and is represented by summary_step.
+        self.absorb = absorb
+        # snapshot(frame): the frame's serialized locals, for "final" values of skipped steps.
+        self.snapshot = snapshot
+        self.active = []
+
+    @property
+    def suppressing(self):
+        """Whether the current iteration of an active loop is left out ahead of time."""
+        return any(state.suppressed for state in self.active)
+
+    def expect(self, frame_key, header, iterations):
+        """The loop at `header` that `frame_key` just entered will run `iterations` times."""
+        if self.active and self.active[-1].frame_key == frame_key and self.active[-1].header == header:
+            self.active[-1].expected = iterations
+
+    def skip(self, frame_key, frame, stack):
+        """Counts a step that was not built; returns the summary step standing for it."""
+        state = next(state for state in self.active if state.suppressed)
+        return state.skip(frame_key, frame, stack)
+
+    def add(self, step, frame_key):
+        if self.active:
+            self.active[-1].add(step, frame_key)
+        else:
+            self.sink(step, frame_key)
+
+    def line(self, frame_key, lineno):
+        """Called for every traced line event, before that line's steps are recorded."""
+        active = self.active
+        while active and active[-1].frame_key == frame_key and not active[-1].header <= lineno <= active[-1].end:
+            active.pop().finish()
+        if active and active[-1].frame_key == frame_key:
+            if lineno == active[-1].header:
+                active[-1].next_iteration()
+                return
+            active[-1].entered = True
+        if lineno in self.loop_ranges and not self.suppressing:
+            parent = active[-1].add if active else self.sink
+            active.append(_LoopState(self, frame_key, lineno, self.loop_ranges[lineno], parent))
+
+    def leave(self, frame_key):
+        """Called when a frame returns: its loops are over."""
+        while self.active and self.active[-1].frame_key == frame_key:
+            self.active.pop().finish()
+
+    def close(self):
+        while self.active:
+            self.active.pop().finish()
+
+class _LoopState:
+    def __init__(self, summarizer, frame_key, header, end, parent):
+        self.summarizer = summarizer
+        self.frame_key = frame_key
+        self.header, self.end = header, end
+        self.parent = parent
+        self.iteration = 1
+        # Whether the current iteration got past the header (the last one may not).
+        self.entered = False
+        self.tail = collections.deque()   # iterations after the first `keep`: [(step, frame_key), ...]
+        self.left_out = []
+        self.summary = None
+        self.expected = None      # iterations predicted on entry
+        self.suppressed = False   # the current iteration is left out ahead of time
+        self.last_frame = None    # the loop's frame at its last skipped step
+        self.last_stack = None
+
+    def add(self, step, frame_key):
+        if self.tail:
+            self.tail[-1].append((step, frame_key))
+        else:
+            self.parent(step, frame_key)
+
+    def next_iteration(self):
+        self.iteration += 1
+        self.entered = False
+        keep = self.summarizer.keep
+        if self.expected is not None and keep < self.iteration <= self.expected - keep:
+            self.suppressed = True
+            event = self._open_summary(self.iteration)["event"]
+            event["iterations"] += 1
+            event["last_iteration"] = event["first_iteration"] + event["iterations"] - 1
+            return
+        self._resume()
+        if self.iteration > keep:
+            self.tail.append([])
+            # One spare: the final header check that ends the loop is not an iteration.
+            if len(self.tail) > keep + 1:
+                self._leave_out(self.tail.popleft())
+
+    def skip(self, frame_key, frame, stack):
+        summary = self.summary
+        summary["event"]["steps"] += 1
+        if frame_key == self.frame_key:
+            self.last_frame, self.last_stack = frame, list(stack)
+            self._track(frame)
+        return summary
+
+    def _track(self, frame):
+        variables = self.summary["event"]["variables"]
+        for name, number in frame.f_locals.items():
+            if isinstance(number, (int, float)) and not isinstance(number, bool) and not name.startswith('__'):
+                stats = variables.setdefault(name, {})
+                stats["min"] = min(stats.get("min", number), number)
+                stats["max"] = max(stats.get("max", number), number)
+
+    def _resume(self):
+        # Skipped steps are serialized once, as the frame stands when they end.
+        if not self.suppressed:
+            return
+        self.suppressed = False
+        if self.last_frame is None:
+            return
+        summary = self.summary
+        self._track(self.last_frame)
+        summary["locals"], summary["stack"] = self.summarizer.snapshot(self.last_frame), self.last_stack
+        for name, value in summary["locals"].items():
+            summary["event"]["variables"].setdefault(name, {})["final"] = value
+        self.last_frame = self.last_stack = None
+
+    def finish(self):
+        self._resume()
+        if len(self.tail) > self.summarizer.keep and self.entered:
+            self._leave_out(self.tail.popleft())
+        if self.summary is not None:
+            self.parent(self.summary, self.frame_key)
+        for iteration in self.tail:
+            for step, frame_key in iteration:
+                self.parent(step, frame_key)
+
+    def _open_summary(self, first):
+        if self.summary is None:
+            self.summary = {
+                "line": self.header,
+                "event": {"type": "loop_summary", "loop_line": self.header, "first_iteration": first,
+                          "last_iteration": first, "iterations": 0, "steps": 0, "variables": {}},
+                "locals": {}, "stack": [],
+            }
+        return self.summary
+
+    def _leave_out(self, iteration):
+        summary = self._open_summary(self.iteration - len(self.tail))
+        event = summary["event"]
+        event["iterations"] += 1
+        event["last_iteration"] = event["first_iteration"] + event["iterations"] - 1
+        event["steps"] += len(iteration)
+        for step, frame_key in iteration:
+            self.summarizer.absorb(step, summary)
+            if frame_key != self.frame_key:
+                continue
+            summary["locals"], summary["stack"] = step.get("locals", {}), step.get("stack", [])
+            for name, value in summary["locals"].items():
+                stats = event["variables"].setdefault(name, {})
+                stats["final"] = value
+                number = value.get("value") if value.get("type") == "primitive" else None
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    stats["min"] = min(stats.get("min", number), number)
+                    stats["max"] = max(stats.get("max", number), number)
+
+# --- Tracing Backends ---
+# A backend turns interpreter events into on_event(frame, event, arg) calls with
+# settrace's event names ("call", "line", "return"), only for code compiled from
+# the submission. on_event returns False for a "call" whose frame should not be
+# traced (and for "line" events outside the scope). "auto" uses sys.monitoring
+# where available (Python 3.12+); "settrace" forces the fallback.
+TRACE_BACKEND = os.environ.get("TRACE_BACKEND", "auto")
+USER_FILENAME = '<string>'
+
+class _SettraceBackend:
+    name = "settrace"
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+
+    def start(self, code):
+        sys.settrace(self._trace)
+
+    def stop(self):
+        sys.settrace(None)
+
+    def _trace(self, frame, event, arg):
+        # Returning None leaves library frames without a local trace function.
+        if frame.f_code.co_filename != USER_FILENAME:
+            return None
+        if self.on_event(frame, event, arg) is False and event == "call":
+            return None
+        return self._trace
+
+class _MonitoringBackend:
+    """
+    sys.monitoring (PEP 669) with events enabled only on the submission's code
+    objects, so library code called by the program runs at full speed. Generator
+    resume/yield are reported as call/return, like settrace does.
+
+    Frames on_event declines are muted: their code object keeps only call and
+    return events while no traced frame of it is running, and module lines
+    outside the scope are disabled for good.
+    """
+    name = "monitoring"
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.tool_id = sys.monitoring.DEBUGGER_ID
+        self.codes = set()
+        self.line_tables = {}
+        self.active = False
+        self.muted = set()
+        self.traced_frames = {}   # code -> number of running traced frames
+
+    def start(self, code):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.use_tool_id(self.tool_id, "codeviz-tracer")
+        self.active = True
+        self.callbacks = {
+            events.PY_START: self._call, events.PY_RESUME: self._call,
+            events.LINE: self._line,
+            events.PY_RETURN: self._return, events.PY_YIELD: self._return,
+            events.PY_UNWIND: self._unwind,
+            events.JUMP: self._jump,
+        }
+        for event, callback in self.callbacks.items():
+            monitoring.register_callback(self.tool_id, event, callback)
+        self.codes = _code_objects(code)
+        self.module_code = code
+        self.quiet_events = events.PY_START | events.PY_RESUME | events.PY_RETURN | events.PY_YIELD
+        self.local_events = self.quiet_events | events.LINE | events.JUMP
+        for user_code in self.codes:
+            monitoring.set_local_events(self.tool_id, user_code, self.local_events)
+        # PY_UNWIND can only be enabled globally; _unwind filters it.
+        monitoring.set_events(self.tool_id, events.PY_UNWIND)
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        monitoring = sys.monitoring
+        monitoring.set_events(self.tool_id, 0)
+        for user_code in self.codes:
+            monitoring.set_local_events(self.tool_id, user_code, 0)
+        for event in self.callbacks:
+            monitoring.register_callback(self.tool_id, event, None)
+        monitoring.free_tool_id(self.tool_id)
+
+    # sys._getframe(1) is the user's frame the event fired in.
+    def _call(self, code, offset):
+        frame = sys._getframe(1)
+        if self.on_event(frame, "call", None) is False:
+            self.muted.add(id(frame))
+            if not self.traced_frames.get(code):
+                sys.monitoring.set_local_events(self.tool_id, code, self.quiet_events)
+            return
+        if not self.traced_frames.get(code):
+            sys.monitoring.set_local_events(self.tool_id, code, self.local_events)
+        self.traced_frames[code] = self.traced_frames.get(code, 0) + 1
+
+    def _line(self, code, line):
+        frame = sys._getframe(1)
+        if id(frame) in self.muted:
+            return
+        if self.on_event(frame, "line", None) is False and code is self.module_code:
+            return sys.monitoring.DISABLE
+
+    def _return(self, code, offset, value):
+        self._leave(code, sys._getframe(1), value)
+
+    def _unwind(self, code, offset, exception):
+        if code in self.codes:
+            self._leave(code, sys._getframe(1), None)
+
+    def _leave(self, code, frame, value):
+        if id(frame) in self.muted:
+            self.muted.discard(id(frame))
+            return
+        self.traced_frames[code] = self.traced_frames.get(code, 1) - 1
+        self.on_event(frame, "return", value)
+
+    def _jump(self, code, offset, destination):
+        # settrace also reports a backward jump within one line (a loop written
+        # on a single line, an inlined comprehension) as a new "line" event.
+        if destination > offset:
+            return sys.monitoring.DISABLE
+        frame = sys._getframe(1)
+        if id(frame) in self.muted:
+            return
+        line = self._line_at(code, destination)
+        if line is not None and line == self._line_at(code, offset):
+            self.on_event(frame, "line", None)
+
+    def _line_at(self, code, offset):
+        table = self.line_tables.get(code)
+        if table is None:
+            table = self.line_tables[code] = list(code.co_lines())
+        index = bisect.bisect_right(table, (offset, float('inf'))) - 1
+        if index >= 0 and offset < table[index][1]:
+            return table[index][2]
+        return None
+
+def _code_objects(code):
+    # The module code and every function, class body and lambda nested in it.
+    found = set()
+    pending = [code]
+    while pending:
+        current = pending.pop()
+        found.add(current)
+        pending.extend(const for const in current.co_consts if inspect.iscode(const))
+    return found
+
+def _make_backend(on_event, backend=None):
+    backend = backend or TRACE_BACKEND
+    # The tool id is taken when a debugger is attached; fall back to settrace then.
+    if backend != "settrace" and hasattr(sys, "monitoring") and sys.monitoring.get_tool(sys.monitoring.DEBUGGER_ID) is None:
+        return _MonitoringBackend(on_event)
+    return _SettraceBackend(on_event)
+
 # --- Main Tracing Logic ---
-def run_with_trace(code_str: str):
+def trace_program(code_str: str, emit, budget: TraceBudget = None, backend: str = None, capture: str = None, scope: TraceScope = None, loop_keep: int = None, keep_alive: bool = False, on_stuck=None):
+    """
+    Executes `code_str` under the tracer and hands every step to
+    `emit(step, frame_key)` as soon as it is final, where frame_key identifies the
+    stack frame the step's locals were read from. Returns the rest of the result
+    (output, call tree, loop context map). With a `scope` (or trace markers in the
+    source) only that part of the program produces steps; with `loop_keep` long
+    loops are summarized (see LoopSummarizer). With `keep_alive` every value
+    serialized into step locals is kept alive until the trace ends, so the ids in
+    the trace stay unique (see HeapTraceEncoder). With `on_stuck`, a program
+    still running TRACE_BACKSTOP_GRACE seconds after its budget is spent has its
+    trace finished from another thread and on_stuck(result) is called there.
+    """
     try:
         tree = ast.parse(code_str)
         analyzer = CodeAnalyzer()
         analyzer.visit(tree)
         line_event_map = analyzer.line_event_map
         loop_context_map = analyzer.loop_context_map
+        line_plans = analyzer.line_plans()
+        capture = (capture or TRACE_CAPTURE) == "execution"
+        if capture:
+            instrumenter = CaptureInstrumenter(analyzer)
+            tree = instrumenter.instrument(tree)
+            instrumented, statement_end = instrumenter.instrumented, instrumenter.statement_end
+        scope = TraceScope.resolve(scope, code_str)
     except SyntaxError as e:
-        return {
-            "trace": [{"line": e.lineno, "event": {"type": "error", "error_type": "SyntaxError", "error_message": e.msg}, "locals": {}, "stack": []}],
-            "output": f"SyntaxError: {e.msg}", "call_tree": None
-        }
+        emit({"line": e.lineno, "event": {"type": "error", "error_type": "SyntaxError", "error_message": e.msg}, "locals": {}, "stack": []}, None)
+        return {"output": f"SyntaxError: {e.msg}", "call_tree": None}
 
-    trace_steps = []
     output_buffer = io.StringIO()
     call_stack = []
     call_tree_root = None
     node_stack = []
-    processed_loops_on_line = set()
+    # frame id -> {for loop line: _LoopRun} for the loops that frame is inside.
+    loop_runs = {}
     pending_trace_step = None
+    pending_frame = None      # the frame pending_trace_step was read from
     final_scope = {} 
+    module_frame_key = None
+    budget = budget or TraceBudget()
+    budget_exceeded = None
+    step_count = 0
+    # Steps produced so far, including ones a loop summary stands for; the step budget counts these.
+    produced_steps = 0
+    last_step = None
+    last_frame_key = None
+    # Capture mode: frame id -> (pending step, last line of its statement) and
+    # frame id -> values captured by the hooks while that step's line runs.
+    pending_steps = {}
+    captures = {}
+    # Frames that run inside the scope as a whole (named functions and their callees).
+    scoped_frames = set()
+    code_in_scope = {}   # code object -> whether its lines overlap a scoped range
+    # id -> value for keep_alive
+    retained = {} if keep_alive else None
+
+    def capture_value(key, value):
+        captures.setdefault(id(sys._getframe(1)), {})[key] = value
+        return value
+
+    def capture_bool(key, value):
+        result = bool(value)
+        captures.setdefault(id(sys._getframe(1)), {})[key] = result
+        return result
+
+    def capture_copy(key, value):
+        captures.setdefault(id(sys._getframe(1)), {})[key] = copy.copy(value)
+        return value
+
+    def finish_pending(frame_key, g, l):
+        step, _ = pending_steps.pop(frame_key)
+        if step["line"] in instrumented:
+            values = captures.pop(frame_key, {})
+            for key, read in instrumenter.reads_after.get(step["line"], {}).items():
+                try:
+                    values[key] = eval(read, g, l)
+                except Exception:
+                    pass
+            step["event"] = _fill_captured_event(step["event"], values, g, l)
+        step["locals"] = serialize_locals(l, retained)
+        record(step, frame_key)
+
+    def record(step, frame_key):
+        nonlocal step_count, produced_steps, last_step, last_frame_key
+        produced_steps += 1
+        last_step, last_frame_key = step, frame_key
+        if summarizer is None:
+            step_count += 1
+            emit(step, frame_key)
+        else:
+            summarizer.add(step, frame_key)
+
+    # With loop summarization a step's index is only known once it leaves the
+    # summarizer, so call tree nodes get their start/end step from deliver().
+    def bind(step, node, field):
+        if summarizer is not None:
+            step_nodes.setdefault(id(step), []).append((node, field))
+
+    def absorb(step, summary):
+        if id(step) in step_nodes:
+            step_nodes.setdefault(id(summary), []).extend(step_nodes.pop(id(step)))
+
+    def deliver(step, frame_key):
+        nonlocal step_count
+        for node, field in step_nodes.pop(id(step), ()):
+            setattr(node, field, step_count)
+        step_count += 1
+        emit(step, frame_key)
 
-    def tracer(frame, event, arg):
-        nonlocal call_stack, call_tree_root, node_stack, processed_loops_on_line, pending_trace_step
+    # A step left out ahead of time: counted, never built. Returns the summary standing for it.
+    def skip(frame_key, frame):
+        nonlocal produced_steps
+        produced_steps += 1
+        return summarizer.skip(frame_key, frame, call_stack)
+
+    def serialize_frame(frame):
+        return serialize_locals(frame.f_locals, retained)
+
+    summarizer = LoopSummarizer(loop_keep, analyzer.loop_ranges, deliver, absorb, serialize_frame) if loop_keep else None
+    step_nodes = {}
+    loop_iterables = analyzer.loop_iterables
+
+    def loop_line_covers(loop_line, lineno):
+        return loop_line <= lineno <= analyzer.loop_ranges[loop_line]
+
+    def code_overlaps_scope(code):
+        if code not in code_in_scope:
+            lines = [line for _, _, line in code.co_lines() if line is not None]
+            code_in_scope[code] = scope.overlaps(code.co_firstlineno, max(lines, default=code.co_firstlineno))
+        return code_in_scope[code]
+
+    # True: traced. False: not traced, and for a call, the frame can run without
+    # events. None: a call or return of a frame that only has some lines in scope.
+    def in_scope(frame, event, lineno):
+        key = id(frame)
+        if frame.f_code.co_name == '<module>':
+            return event != "line" or scope.covers(lineno)
+        if event == "call":
+            caller = frame.f_back
+            if frame.f_code.co_name in scope.functions or (caller is not None and (id(caller) in scoped_frames or scope.covers(caller.f_lineno))):
+                scoped_frames.add(key)
+                return True
+            return None if code_overlaps_scope(frame.f_code) else False
+        if key in scoped_frames:
+            if event == "return":
+                scoped_frames.discard(key)
+            return True
+        if event == "line":
+            return scope.covers(lineno)
+        return None if event == "return" and code_overlaps_scope(frame.f_code) else False
+
+    def on_event(frame, event, arg):
+        nonlocal call_stack, call_tree_root, node_stack, pending_trace_step, pending_frame, module_frame_key
         func_name = frame.f_code.co_name
         lineno = frame.f_lineno
+        budget.check(produced_steps)
+        traced = scope is None or in_scope(frame, event, lineno)
+        if traced is False and event != "line":
+            return False
 
-        if pending_trace_step and event in ("line", "return", "call"):
-            pending_trace_step["locals"] = {k: serialize_value(v) for k, v in frame.f_locals.items() if not k.startswith('__')}
-            trace_steps.append(pending_trace_step)
-            pending_trace_step = None
+        if capture:
+            # A step is complete once its own frame leaves the statement; calls
+            # made from the line do not complete it.
+            pending = pending_steps.get(id(frame))
+            if pending and (event == "return" or (event == "line" and not pending[0]["line"] < lineno <= pending[1])):
+                finish_pending(id(frame), frame.f_globals, frame.f_locals)
+        elif pending_trace_step and event in ("line", "return", "call"):
+            # On a call from the pending line, `frame` is the callee's.
+            pending_trace_step["locals"] = serialize_locals(pending_frame.f_locals, retained)
+            record(pending_trace_step, id(pending_frame))
+            pending_trace_step = pending_frame = None
+
+        if not traced:
+            # Out-of-scope lines only complete the step before them. A frame with
+            # only some lines in scope produces no call or return steps.
+            if event == "return":
+                loop_runs.pop(id(frame), None)
+                if summarizer is not None:
+                    summarizer.leave(id(frame))
+            return traced
+
+        if summarizer is not None:
+            if event == "line":
+                summarizer.line(id(frame), lineno)
+            elif event == "return":
+                summarizer.leave(id(frame))
+        suppressed = summarizer is not None and summarizer.suppressing
+
+        if event == "call" and func_name == '<module>':
+            module_frame_key = id(frame)
 
         if event == "call" and func_name != '<module>':
-            processed_loops_on_line.clear()
             call_stack.append(func_name)
             args_repr = {k: repr(v) for k, v in inspect.getargvalues(frame).locals.items()}
             parent_id = node_stack[-1].id if node_stack else None
-            new_node = CallTreeNode(func_name, args_repr, len(trace_steps), parent_id)
+            new_node = CallTreeNode(func_name, args_repr, step_count, parent_id)
             if not call_tree_root: call_tree_root = new_node
             elif node_stack: node_stack[-1].children.append(new_node)
             node_stack.append(new_node)
 
-            if frame.f_back:
+            if frame.f_back and suppressed:
+                bind(skip(id(frame.f_back), frame.f_back), new_node, "start_step")
+            elif frame.f_back:
                 caller_line = frame.f_back.f_lineno
                 func_args = {k: serialize_value(v) for k, v in inspect.getargvalues(frame).locals.items()}
                 
@@ -661,43 +2085,103 @@ def run_with_trace(code_str: str):
                         "function_name": func_name,
                         "arguments": func_args
                     },
-                    "locals": {k: serialize_value(v) for k, v in frame.f_back.f_locals.items() if not k.startswith('__')},
+                    "locals": serialize_locals(frame.f_back.f_locals, retained),
                     "stack": copy.deepcopy(call_stack)
                 }
-                trace_steps.append(call_event_step)
+                record(call_event_step, id(frame.f_back))
+                bind(call_event_step, new_node, "start_step")
 
         if event == "line":
-            if lineno in loop_context_map:
-                loop_info = loop_context_map[lineno]
-                if lineno == loop_info.get('start_line') and loop_info['loop_line'] not in processed_loops_on_line:
-                    try:
-                        current_value = frame.f_locals.get(loop_info['variable'])
-                        iterable_obj = eval(loop_info['iterable'], frame.f_globals, frame.f_locals)
-                        serialized_iterable = [serialize_value(item) for item in list(iterable_obj)]
-                        iteration_event = {
-                            "type": "loop_iteration", 
-                            "loop_variable_name": loop_info['variable'], 
-                            "current_value": current_value, 
-                            "iterable_snapshot": serialized_iterable,
-                            "start_line": loop_info['start_line']
-                        }
-                        locals_copy = {k: serialize_value(v) for k, v in frame.f_locals.items() if not k.startswith('__')}
-                        trace_steps.append({"line": loop_info['loop_line'], "event": iteration_event, "locals": locals_copy, "stack": copy.deepcopy(call_stack)})
-                        processed_loops_on_line.add(loop_info['loop_line'])
-                    except Exception: pass
-            else:
-                processed_loops_on_line.clear()
-            
+            runs = loop_runs.get(id(frame))
+            if runs:
+                for loop_line in [l for l in runs if not loop_line_covers(l, lineno)]:
+                    del runs[loop_line]
+            if lineno in loop_iterables:
+                # The header runs once per iteration and once more when the loop ends.
+                runs = loop_runs.setdefault(id(frame), {})
+                if lineno in runs:
+                    runs[lineno].armed = True
+                else:
+                    runs[lineno] = _LoopRun(loop_iterables[lineno])
+                    if summarizer is not None and not suppressed and runs[lineno].plan is not None and not runs[lineno].plan["exits_early"]:
+                        iterations = runs[lineno].length(frame)
+                        if iterations is not None:
+                            summarizer.expect(id(frame), lineno, iterations)
+            loop_info = loop_context_map.get(lineno)
+            if loop_info and lineno == loop_info.get('start_line') and runs and loop_info['loop_line'] in runs:
+                run = runs[loop_info['loop_line']]
+                if run.armed:
+                    run.armed = False
+                    run.index += 1
+                    if suppressed:
+                        skip(id(frame), frame)
+                    else:
+                        try:
+                            current_value = frame.f_locals.get(loop_info['variable'])
+                            iteration_event = {
+                                "type": "loop_iteration", 
+                                "loop_variable_name": loop_info['variable'], 
+                                "current_value": current_value, 
+                                "start_line": loop_info['start_line'],
+                                "index": run.index
+                            }
+                            if summarizer is None and run.plan is not None:
+                                if run.changed(current_value):
+                                    snapshot = run.take_snapshot(frame)
+                                    if snapshot is not None:
+                                        iteration_event["iterable_snapshot"] = snapshot
+                                        run.snapshot_step = step_count
+                                    else:
+                                        run.plan = None
+                                if run.snapshot_step is not None:
+                                    iteration_event["snapshot_step"] = run.snapshot_step
+                            locals_copy = serialize_locals(frame.f_locals, retained)
+                            record({"line": loop_info['loop_line'], "event": iteration_event, "locals": locals_copy, "stack": copy.deepcopy(call_stack)}, id(frame))
+                        except Exception: pass
+
             static_event = line_event_map.get(lineno)
+            if runs and static_event and static_event.get("type") == "array_operation":
+                for run in runs.values():
+                    if run.plan is not None and static_event.get("target_var") in run.plan["sources"]:
+                        run.dirty = True
             if static_event:
                 is_return_statement = static_event.get("type") in ["return_statement", "for_loop_start"]
                 if is_return_statement:
                     pending_trace_step = None 
+                elif capture and func_name in _EXPRESSION_SCOPES:
+                    pass
+                elif suppressed:
+                    skip(id(frame), frame)
+                elif capture:
+                    if lineno in instrumented:
+                        values = {}
+                        for key, read in instrumenter.reads_before.get(lineno, {}).items():
+                            try:
+                                values[key] = eval(read, frame.f_globals, frame.f_locals)
+                            except Exception:
+                                pass
+                        captures[id(frame)] = values
+                        line_event = static_event
+                    else:
+                        line_event = _enrich_event(static_event, line_plans[lineno], frame)
+                    pending_steps[id(frame)] = ({"line": lineno, "event": line_event, "stack": copy.deepcopy(call_stack)}, statement_end[lineno])
                 else:
-                    enriched_event = _enrich_event(static_event, frame)
+                    enriched_event = _enrich_event(static_event, line_plans[lineno], frame)
                     pending_trace_step = {"line": lineno, "event": enriched_event, "stack": copy.deepcopy(call_stack)}
+                    pending_frame = frame
+
+        if event == "return":
+            loop_runs.pop(id(frame), None)
 
-        if event == "return" and func_name != '<module>':
+        if event == "return" and func_name != '<module>' and suppressed:
+            summary = skip(id(frame), frame)
+            if call_stack and call_stack[-1] == func_name: call_stack.pop()
+            if node_stack and node_stack[-1].name == func_name:
+                node = node_stack.pop()
+                node.return_value = serialize_value(arg)
+                bind(summary, node, "end_step")
+            pending_trace_step = None
+        elif event == "return" and func_name != '<module>':
             return_event = {
                 "type": "return_value", 
                 "function_name": func_name,
@@ -705,17 +2189,18 @@ def run_with_trace(code_str: str):
                 "return_to_line": frame.f_back.f_lineno if frame.f_back else None
             }
             
-            # 1. Append the trace step FIRST
-            trace_steps.append({
+            # 1. Record the trace step FIRST
+            return_step = {
                 "line": lineno, 
                 "event": return_event, 
-                "locals": {k: serialize_value(v) for k, v in frame.f_locals.items() if not k.startswith('__')}, 
+                "locals": serialize_locals(frame.f_locals, retained), 
                 "stack": copy.deepcopy(call_stack)
-            })
+            }
+            record(return_step, id(frame))
             
             # 2. Calculate the index of the step we just added.
             # This index represents EXACTLY when the function finished.
-            execution_end_index = len(trace_steps) - 1
+            execution_end_index = step_count - 1
 
             # 3. Update the Tree Node
             if call_stack and call_stack[-1] == func_name: call_stack.pop()
@@ -724,40 +2209,189 @@ def run_with_trace(code_str: str):
                 node.return_value = serialize_value(arg)
                 # ⭐ CRITICAL: Set the end_step to the current trace index
                 node.end_step = execution_end_index
+                bind(return_step, node, "end_step")
             
             pending_trace_step = None
-        
-        return tracer
     
     original_stdout = sys.stdout
     sys.stdout = output_buffer
     global_scope = {'__name__': '__main__'}
-    sys.settrace(tracer)
+    if capture:
+        global_scope['__builtins__'] = {**builtins.__dict__, CAPTURE_HOOK: capture_value, CAPTURE_BOOL_HOOK: capture_bool, CAPTURE_COPY_HOOK: capture_copy}
+    tracer = _make_backend(on_event, backend)
+    # The trace is finished once: by the program's thread, or by the backstop's
+    # while the program is stuck (the spent budget keeps on_event from recording).
+    finishing = threading.Lock()
+    result = None
+
+    def finish(budget_exceeded, error=None):
+        nonlocal result
+        with finishing:
+            if result is None:
+                result = complete(budget_exceeded, error)
+            return result
+
+    def complete(budget_exceeded, error):
+        nonlocal final_scope
+        # record() is Python code; stop tracing before calling it from here.
+        tracer.stop()
+        # Restore stdout first: emit() may raise when a streaming client goes away.
+        sys.stdout = original_stdout
+        if error is not None:
+            if summarizer is not None:
+                summarizer.close()
+            error_line = last_step['line'] if last_step else -1
+            record({"line": error_line, "event": {"type": "error", "error_type": type(error).__name__, "error_message": str(error)}, "locals": last_step.get('locals', {}) if last_step else {}, "stack": last_step.get('stack', []) if last_step else []}, last_frame_key if last_step else module_frame_key)
+        if pending_trace_step:
+            final_scope = serialize_locals(global_scope, retained)
+            pending_trace_step["locals"] = final_scope
+            record(pending_trace_step, module_frame_key)
+        elif module_frame_key in pending_steps:
+            final_scope = serialize_locals(global_scope, retained)
+            finish_pending(module_frame_key, global_scope, global_scope)
+        if summarizer is not None:
+            summarizer.close()
+
+        if budget_exceeded:
+            # The partial trace ends with the budget event instead of execution_finished.
+            record({
+                "line": last_step['line'] if last_step else -1,
+                "event": {"type": "budget_exceeded", "limit": budget_exceeded.limit, "limit_value": budget_exceeded.value, "message": budget_exceeded.message},
+                "locals": last_step.get('locals', {}) if last_step else {},
+                "stack": last_step.get('stack', []) if last_step else []
+            }, last_frame_key if last_step else module_frame_key)
+        elif last_step:
+            last_line = last_step['line']
+            final_locals = final_scope if final_scope else last_step.get('locals', {})
+            record({
+                "line": last_line,
+                "event": {"type": "execution_finished"},
+                "locals": final_locals,
+                "stack": [] 
+            }, module_frame_key if final_scope else last_frame_key)
+
+        return {"output": output_buffer.getvalue(), "call_tree": call_tree_root.to_dict() if call_tree_root else None, "loop_context_map": loop_context_map}
+
+    budget.start()
+    backstop = _Backstop(budget, lambda: on_stuck(finish(budget.exceeded))) if on_stuck else None
+    error = None
     try:
-        exec(compile(code_str, '<string>', 'exec'), global_scope)
+        code = compile(tree, USER_FILENAME, 'exec')
+        tracer.start(code)
+        exec(code, global_scope)
+        # The program may have caught the budget exception and finished on its own.
+        budget_exceeded = budget.exceeded
+    except TraceBudgetExceeded as e:
+        budget_exceeded = budget.exceeded or e
     except Exception as e:
-        error_line = trace_steps[-1]['line'] if trace_steps else -1
-        trace_steps.append({"line": error_line, "event": {"type": "error", "error_type": type(e).__name__, "error_message": str(e)}, "locals": trace_steps[-1].get('locals', {}) if trace_steps else {}, "stack": trace_steps[-1].get('stack', []) if trace_steps else []})
+        error = e
+    except BaseException:
+        finish(budget.exceeded)
+        raise
     finally:
-        sys.settrace(None)
-        if pending_trace_step:
-            final_scope = {k: serialize_value(v) for k, v in global_scope.items() if not k.startswith('__')}
-            pending_trace_step["locals"] = final_scope
-            trace_steps.append(pending_trace_step)
-        
-        sys.stdout = original_stdout
-    
-    if trace_steps:
-        last_line = trace_steps[-1]['line']
-        final_locals = final_scope if final_scope else trace_steps[-1].get('locals', {})
-        trace_steps.append({
-            "line": last_line,
-            "event": {"type": "execution_finished"},
-            "locals": final_locals,
-            "stack": [] 
-        })
-
-    return {"trace": trace_steps, "output": output_buffer.getvalue(), "call_tree": call_tree_root.to_dict() if call_tree_root else None, "loop_context_map": loop_context_map}
+        if backstop is not None:
+            backstop.stop()
+    return finish(budget_exceeded, error)
+
+def _step_sink(trace_format, sink, heap=None):
+    # Adapts sink(step) to trace_program's emit(step, frame_key) in the requested
+    # format. Heap encoding, when on, runs before delta encoding.
+    encode_heap = heap.encode if heap is not None else (lambda step: step)
+    if trace_format != "delta":
+        return lambda step, frame_key: sink(encode_heap(step))
+    encoder = DeltaTraceEncoder()
+    def emit(step, frame_key):
+        sink(encoder.encode(encode_heap(step), frame_key))
+        if step["event"].get("type") == "return_value":
+            encoder.forget(frame_key)
+    return emit
+
+def _format_fields(trace_format, heap=None):
+    fields = {}
+    if trace_format == "delta":
+        fields.update(trace_format="delta", keyframe_interval=DELTA_KEYFRAME_INTERVAL)
+    if heap is not None:
+        fields["heap"] = heap.heap
+    return fields
+
+def run_with_trace(code_str: str, trace_format: str = "full", budget: TraceBudget = None, heap: bool = False, scope: TraceScope = None, loop_keep: int = None, on_stuck=None, capture: str = None):
+    trace_steps = []
+    heap = HeapTraceEncoder() if heap else None
+    result = lambda rest: {"trace": trace_steps, **rest, **_format_fields(trace_format, heap)}
+    rest = trace_program(code_str, _step_sink(trace_format, trace_steps.append, heap), budget, capture=capture, scope=scope, loop_keep=loop_keep, keep_alive=heap is not None,
+                         on_stuck=on_stuck and (lambda rest: on_stuck(result(rest))))
+    return result(rest)
+
+# --- Streaming ---
+# Number of finished steps a streaming trace may hold before the program blocks
+# and waits for the consumer.
+TRACE_STREAM_BUFFER = int(os.environ.get("TRACE_STREAM_BUFFER", 64))
+
+class TraceCancelled(TraceBudgetExceeded):
+    def __init__(self):
+        super().__init__("cancelled", None, "Trace cancelled by the client.")
+
+def stream_trace(code_str: str, trace_format: str = "full", budget: TraceBudget = None, emit=None, heap: bool = False, scope: TraceScope = None, loop_keep: int = None, on_stuck=None, capture: str = None):
+    """
+    run_with_trace without the "trace" list: each step goes to `emit(step)` as
+    soon as it is final and everything else, including the heap table, is
+    returned at the end. Used by the sandbox's streaming job.
+    """
+    heap = HeapTraceEncoder() if heap else None
+    result = lambda rest: {**rest, **_format_fields(trace_format, heap)}
+    rest = trace_program(code_str, _step_sink(trace_format, emit, heap), budget, capture=capture, scope=scope, loop_keep=loop_keep, keep_alive=heap is not None,
+                         on_stuck=on_stuck and (lambda rest: on_stuck(result(rest))))
+    return result(rest)
+
+def iter_trace(code_str: str, trace_format: str = "full", budget: TraceBudget = None, buffer_size: int = TRACE_STREAM_BUFFER, heap: bool = False, scope: TraceScope = None, loop_keep: int = None, capture: str = None):
+    """
+    Generator form of run_with_trace: yields ("step", step) for every step while
+    the program runs, then ("end", rest). The program runs in a background thread
+    and pauses whenever `buffer_size` steps are waiting to be consumed; closing
+    the generator stops it. sys.stdout is redirected process-wide while it runs,
+    so use it inside a sandbox worker rather than in the API process. A program
+    that swallows the cancellation under settrace is left running in its daemon
+    thread (there is no backstop here).
+    """
+    channel = queue.Queue(maxsize=buffer_size)
+    closed = threading.Event()
+    budget = budget or TraceBudget()
+
+    def put(item):
+        while not closed.is_set():
+            try:
+                channel.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        # Tripping the budget makes every later tracer event raise it again.
+        raise budget.trip(TraceCancelled())
+
+    def run():
+        try:
+            rest = stream_trace(code_str, trace_format, budget, emit=lambda step: put(("step", step)), heap=heap, scope=scope, loop_keep=loop_keep, capture=capture)
+            put(("end", rest))
+        except TraceCancelled:
+            pass
+        except Exception as e:
+            try:
+                put(("error", e))
+            except TraceCancelled:
+                pass
+
+    worker = threading.Thread(target=run, name="iter-trace", daemon=True)
+    worker.start()
+    try:
+        while True:
+            kind, payload = channel.get()
+            if kind == "error":
+                raise payload
+            yield kind, payload
+            if kind == "end":
+                return
+    finally:
+        closed.set()
+        worker.join(TRACE_BACKSTOP_GRACE)
 
 # --- Flowchart Generator ---
 def generate_simple_flowchart(code_str: str):
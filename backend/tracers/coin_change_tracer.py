@@ -1,6 +1,6 @@
 from typing import List
-import copy
 import uuid
+from tracers.recursion_tree import RecursionTreeRecorder
 
 # --- Bottom-Up Tracer ---
 def trace_coin_change_bottom_up(coins: List[int], amount: int):
@@ -38,58 +38,26 @@ def trace_coin_change_bottom_up(coins: List[int], amount: int):
     return trace, final_value
 
 # --- Top-Down Tracer ---
-def trace_coin_change_top_down(coins: List[int], amount: int):
+def trace_coin_change_top_down(coins: List[int], amount: int, frames: str = "full"):
     memo = {}
-    trace = []
-    initial_tree = {"id": "root", "name": f"CC({amount})", "children": []}
-    tree_states = [initial_tree]
+    recorder = RecursionTreeRecorder(f"CC({amount})", format_memo_value=lambda v: v if v != float('inf') else '∞')
 
     def coin_change_recursive(rem_amount, parent_id):
         memo_key = str(rem_amount)
         node_id = f"node-{rem_amount}-{uuid.uuid4().hex[:4]}"
-        
-        new_node = {"id": node_id, "name": f"CC({rem_amount})", "children": []}
-        latest_tree = copy.deepcopy(tree_states[-1])
-        q = [latest_tree]
-        while q:
-            curr = q.pop(0)
-            if curr["id"] == parent_id: curr["children"].append(new_node); break
-            q.extend(curr.get("children", []))
-        tree_states.append(latest_tree)
-        trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Calling Coin Change for amount {rem_amount}."})
+        recorder.add(parent_id, node_id, f"CC({rem_amount})", f"Calling Coin Change for amount {rem_amount}.")
 
         if rem_amount < 0:
-            latest_tree = copy.deepcopy(tree_states[-1])
-            q = [latest_tree]
-            while q:
-                curr = q.pop(0)
-                if curr["id"] == node_id: curr["name"] += " = ∞ (Invalid)"; break
-                q.extend(curr.get("children", []))
-            tree_states.append(latest_tree)
-            trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Amount {rem_amount} is invalid."})
+            recorder.label(node_id, " = ∞ (Invalid)", f"Amount {rem_amount} is invalid.")
             return float('inf')
 
         if rem_amount == 0:
-            latest_tree = copy.deepcopy(tree_states[-1])
-            q = [latest_tree]
-            while q:
-                curr = q.pop(0)
-                if curr["id"] == node_id: curr["name"] += " = 0 (Base Case)"; break
-                q.extend(curr.get("children", []))
-            tree_states.append(latest_tree)
-            trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Amount is 0, returning 0 coins."})
+            recorder.label(node_id, " = 0 (Base Case)", f"Amount is 0, returning 0 coins.")
             return 0
         
         if memo_key in memo:
             result = memo[memo_key]
-            latest_tree = copy.deepcopy(tree_states[-1])
-            q = [latest_tree]
-            while q:
-                curr = q.pop(0)
-                if curr["id"] == node_id: curr["name"] += f" = {result if result != float('inf') else '∞'} (Memo)"; break
-                q.extend(curr.get("children", []))
-            tree_states.append(latest_tree)
-            trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": {k: (v if v != float('inf') else '∞') for k, v in memo.items()}}}], "explanation": f"Found CC({rem_amount}) in memo."})
+            recorder.label(node_id, f" = {result if result != float('inf') else '∞'} (Memo)", f"Found CC({rem_amount}) in memo.")
             return result
 
         min_coins = float('inf')
@@ -99,19 +67,8 @@ def trace_coin_change_top_down(coins: List[int], amount: int):
                 min_coins = min(min_coins, 1 + res)
         
         memo[memo_key] = min_coins
-        latest_tree = copy.deepcopy(tree_states[-1])
-        q = [latest_tree]
-        while q:
-            curr = q.pop(0)
-            if curr["id"] == node_id: curr["name"] += f" = {min_coins if min_coins != float('inf') else '∞'}"; break
-            q.extend(curr.get("children", []))
-        tree_states.append(latest_tree)
-        trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": {k: (v if v != float('inf') else '∞') for k, v in memo.items()}}}], "explanation": f"Computed CC({rem_amount}). Storing in memo."})
+        recorder.label(node_id, f" = {min_coins if min_coins != float('inf') else '∞'}", f"Computed CC({rem_amount}). Storing in memo.", {memo_key: min_coins})
         return min_coins
 
     coin_change_recursive(amount, "root")
-    for frame in trace:
-        for viz in frame["visualizations"]:
-            if viz["type"] == "key-value":
-                viz["data"]["memo"] = {k: (v if v != float('inf') else '∞') for k, v in viz["data"]["memo"].items()}
-    return trace
\ No newline at end of file
+    return recorder.to_events() if frames == "delta" else recorder.to_frames()
@@ -0,0 +1,97 @@
+# --- Grid Cell Format ---
+# Bottom-up tracers send their DP table once and then one cell update per step
+# (?frames=delta on /api/visualize/{algo_id}):
+#
+#   {"format": "grid-cells",
+#    "title": str, "n": int, "m": int, "rowLabels": [...], "colLabels": [...],
+#    "initial": [{"i", "j", "value"}, ...],         # cells known before step 0
+#    "keyframe_interval": K,                        # 0 when there are no keyframes
+#    "steps": [{"explanation": str,
+#               "cell": {"i", "j", "value"} | null,  # the cell written by this step
+#               "highlightedCell": {"i", "j"} | null,
+#               "variables": {"title": str, "data": {...}},
+#               "keyframe": [{"i", "j", "value"}, ...]},  # every K steps: all known cells
+#              ...]}
+#
+# Frame k is "initial" (or the nearest keyframe at or before k) with the "cell"
+# updates up to and including step k applied. The DP page requests this format
+# and rebuilds the frame on screen, rewinding to keyframes when stepping back
+# (frontend/src/utils/dpFrames.js); expand_grid_cells produces the legacy full
+# frames.
+
+class GridFrameRecorder:
+    def __init__(self, title, n, m, row_labels, col_labels, initial_cells, keyframe_interval=0):
+        self.title = title
+        self.n, self.m = n, m
+        self.row_labels, self.col_labels = row_labels, col_labels
+        self.initial = initial_cells
+        self.keyframe_interval = keyframe_interval
+        self.steps = []
+        # Only needed to write keyframes.
+        self._replay = _GridReplay(n, m, initial_cells) if keyframe_interval else None
+
+    def record(self, explanation, variables_title, variables, cell=None, highlighted=None):
+        step = {
+            "explanation": explanation,
+            "cell": cell,
+            "highlightedCell": highlighted,
+            "variables": {"title": variables_title, "data": variables},
+        }
+        if self._replay is not None:
+            self._replay.apply(cell)
+            if len(self.steps) % self.keyframe_interval == 0:
+                step["keyframe"] = self._replay.cells()
+        self.steps.append(step)
+
+    def to_cells(self):
+        return {
+            "format": "grid-cells",
+            "title": self.title, "n": self.n, "m": self.m,
+            "rowLabels": self.row_labels, "colLabels": self.col_labels,
+            "initial": self.initial,
+            "keyframe_interval": self.keyframe_interval,
+            "steps": self.steps,
+        }
+
+    def to_frames(self):
+        return expand_grid_cells(self.to_cells())
+
+class _GridReplay:
+    def __init__(self, n, m, cells):
+        self.grid = [[None] * (m + 1) for _ in range(n + 1)]
+        self.load(cells)
+
+    def load(self, cells):
+        for cell in cells:
+            self.grid[cell["i"]][cell["j"]] = cell["value"]
+
+    def apply(self, cell):
+        if cell is not None:
+            self.grid[cell["i"]][cell["j"]] = cell["value"]
+
+    def cells(self):
+        return [{"i": r, "j": c, "value": value} for r, row in enumerate(self.grid) for c, value in enumerate(row) if value is not None]
+
+def _frame(cells_trace, step, cells):
+    return {
+        "explanation": step["explanation"],
+        "visualizations": [
+            {"type": "grid-2d", "title": cells_trace["title"], "data": {
+                "steps": cells,
+                "n": cells_trace["n"], "m": cells_trace["m"],
+                "highlightedCell": step["highlightedCell"],
+                "rowLabels": cells_trace["rowLabels"],
+                "colLabels": cells_trace["colLabels"],
+            }},
+            {"type": "variables", "title": step["variables"]["title"], "data": step["variables"]["data"]},
+        ],
+    }
+
+def expand_grid_cells(cells_trace):
+    """Rebuilds every frame of a grid-cells trace in the legacy frame format."""
+    replay = _GridReplay(cells_trace["n"], cells_trace["m"], cells_trace["initial"])
+    frames = []
+    for step in cells_trace["steps"]:
+        replay.apply(step["cell"])
+        frames.append(_frame(cells_trace, step, replay.cells()))
+    return frames
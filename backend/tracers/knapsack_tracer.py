@@ -1,12 +1,15 @@
 from typing import List
-import copy
 import uuid
+from tracers.recursion_tree import RecursionTreeRecorder
+from tracers.grid_frames import GridFrameRecorder
 
 # --- Bottom-Up Tracer ---
-def trace_knapsack_bottom_up(weights: List[int], values: List[int], capacity: int):
+def trace_knapsack_bottom_up(weights: List[int], values: List[int], capacity: int, frames: str = "full", keyframe_interval: int = 0):
     n = len(weights)
     dp = [[0] * (capacity + 1) for _ in range(n + 1)]
-    trace = []
+    # Row 0 and column 0 are the base cases; each step then fills one cell.
+    initial_cells = [{"i": r, "j": c, "value": 0} for r in range(n + 1) for c in range(capacity + 1) if r == 0 or c == 0]
+    recorder = GridFrameRecorder("Knapsack Table", n, capacity, ["-"] + [f"Item {k+1}" for k in range(n)], [f"{k}" for k in range(capacity+1)], initial_cells, keyframe_interval)
 
     for i in range(1, n + 1):
         for w in range(1, capacity + 1):
@@ -20,68 +23,31 @@ def trace_knapsack_bottom_up(weights: List[int], values: List[int], capacity: in
                 dp[i][w] = max(val_included, val_not_included)
                 explanation = f"Item {i}: max(include: {val_included}, exclude: {val_not_included})"
 
-            steps_snapshot = [{"i": r, "j": c, "value": dp[r][c]} for r in range(n + 1) for c in range(capacity + 1) if dp[r][c] != 0 or (r <= i and c <= w)]
-
-            trace.append({
-                "explanation": explanation,
-                "visualizations": [
-                    {
-                        "type": "grid-2d", "title": "Knapsack Table",
-                        "data": { "steps": steps_snapshot, "n": n, "m": capacity, "highlightedCell": {"i": i, "j": w}, "rowLabels": ["-"] + [f"Item {k+1}" for k in range(n)], "colLabels": [f"{k}" for k in range(capacity+1)] }
-                    },
-                    {
-                        "type": "variables", "title": "State",
-                        "data": { "Item (i)": i, "Capacity (w)": w, "Weight": weights[i-1], "Value": values[i-1] }
-                    }
-                ]
-            })
+            recorder.record(explanation, "State", { "Item (i)": i, "Capacity (w)": w, "Weight": weights[i-1], "Value": values[i-1] },
+                            cell={"i": i, "j": w, "value": dp[i][w]}, highlighted={"i": i, "j": w})
 
     final_value = dp[n][capacity]
+    trace = recorder.to_cells() if frames == "delta" else recorder.to_frames()
     return trace, final_value
 
 # --- Top-Down Tracer ---
-def trace_knapsack_top_down(weights: List[int], values: List[int], capacity: int):
+def trace_knapsack_top_down(weights: List[int], values: List[int], capacity: int, frames: str = "full"):
     memo = {}
-    trace = []
     n = len(weights)
-    initial_tree = {"id": "root", "name": f"KS({n}, {capacity})", "children": []}
-    tree_states = [initial_tree]
+    recorder = RecursionTreeRecorder(f"KS({n}, {capacity})")
 
     def knapsack_recursive(i, w, parent_id):
         memo_key = f"({i},{w})"
         node_id = f"node-{i}-{w}-{uuid.uuid4().hex[:4]}"
-
-        new_node = {"id": node_id, "name": f"KS({i},{w})", "children": []}
-        latest_tree = copy.deepcopy(tree_states[-1])
-        q = [latest_tree]
-        while q:
-            curr = q.pop(0)
-            if curr["id"] == parent_id: curr["children"].append(new_node); break
-            q.extend(curr.get("children", []))
-        tree_states.append(latest_tree)
-        trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Calling Knapsack for Item {i} with capacity {w}."})
+        recorder.add(parent_id, node_id, f"KS({i},{w})", f"Calling Knapsack for Item {i} with capacity {w}.")
         
         if memo_key in memo:
             result = memo[memo_key]
-            latest_tree = copy.deepcopy(tree_states[-1])
-            q = [latest_tree]
-            while q:
-                curr = q.pop(0)
-                if curr["id"] == node_id: curr["name"] += f" = {result} (Memo)"; break
-                q.extend(curr.get("children", []))
-            tree_states.append(latest_tree)
-            trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Found KS({i},{w}) in memo. Value = {result}."})
+            recorder.label(node_id, f" = {result} (Memo)", f"Found KS({i},{w}) in memo. Value = {result}.")
             return result
 
         if i == 0 or w == 0:
-            latest_tree = copy.deepcopy(tree_states[-1])
-            q = [latest_tree]
-            while q:
-                curr = q.pop(0)
-                if curr["id"] == node_id: curr["name"] += " = 0 (Base Case)"; break
-                q.extend(curr.get("children", []))
-            tree_states.append(latest_tree)
-            trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Base case for KS({i},{w}). Value = 0."})
+            recorder.label(node_id, " = 0 (Base Case)", f"Base case for KS({i},{w}). Value = 0.")
             return 0
 
         if weights[i - 1] > w:
@@ -90,15 +56,8 @@ def trace_knapsack_top_down(weights: List[int], values: List[int], capacity: int
             result = max(values[i - 1] + knapsack_recursive(i - 1, w - weights[i - 1], node_id), knapsack_recursive(i - 1, w, node_id))
         
         memo[memo_key] = result
-        latest_tree = copy.deepcopy(tree_states[-1])
-        q = [latest_tree]
-        while q:
-            curr = q.pop(0)
-            if curr["id"] == node_id: curr["name"] += f" = {result}"; break
-            q.extend(curr.get("children", []))
-        tree_states.append(latest_tree)
-        trace.append({"visualizations": [{"type": "tree", "title": "Recursion Tree", "data": {"data": [latest_tree], "activeNodeId": node_id}}, {"type": "key-value", "title": "Memoization Table", "data": {"memo": dict(memo)}}], "explanation": f"Computed KS({i},{w}) = {result}. Storing in memo."})
+        recorder.label(node_id, f" = {result}", f"Computed KS({i},{w}) = {result}. Storing in memo.", {memo_key: result})
         return result
 
     knapsack_recursive(n, capacity, "root")
-    return trace
\ No newline at end of file
+    return recorder.to_events() if frames == "delta" else recorder.to_frames()
@@ -0,0 +1,105 @@
+TREE_TITLE = "Recursion Tree"
+MEMO_TITLE = "Memoization Table"
+
+# --- Tree Event Format ---
+# Top-down tracers record their recursion tree as one event per step instead of
+# a full tree copy per step (?frames=delta on /api/visualize/{algo_id}):
+#
+#   {"format": "tree-events",
+#    "root": {"id": "root", "name": ...},
+#    "steps": [{"explanation": str, "activeNodeId": str,
+#               "event": {"op": "add", "id", "parent", "name"}
+#                      | {"op": "label", "id", "name"},   # name is the full new label
+#               "memo_set": {key: value}},                 # only when the memo changed
+#              ...],
+#    "final_tree": {...}, "final_memo": {...}}
+#
+# Frame k is the root with the events of steps 0..k applied in order, and the
+# memo built the same way from "memo_set". The DP page requests this format and
+# rebuilds the frame on screen (frontend/src/utils/dpFrames.js);
+# expand_tree_events produces the legacy full frames.
+
+class RecursionTreeRecorder:
+    def __init__(self, root_name, format_memo_value=None):
+        self.root_name = root_name
+        self.root = {"id": "root", "name": root_name, "children": []}
+        self.nodes = {"root": self.root}
+        self.memo = {}
+        self.steps = []
+        self.format_memo_value = format_memo_value or (lambda value: value)
+
+    def add(self, parent_id, node_id, name, explanation):
+        node = {"id": node_id, "name": name, "children": []}
+        self.nodes[node_id] = node
+        self.nodes[parent_id]["children"].append(node)
+        self._record({"op": "add", "id": node_id, "parent": parent_id, "name": name}, node_id, explanation)
+
+    def label(self, node_id, suffix, explanation, memo_set=None):
+        node = self.nodes[node_id]
+        node["name"] += suffix
+        self._record({"op": "label", "id": node_id, "name": node["name"]}, node_id, explanation, memo_set)
+
+    def _record(self, event, active_id, explanation, memo_set=None):
+        step = {"explanation": explanation, "activeNodeId": active_id, "event": event}
+        if memo_set:
+            memo_set = {key: self.format_memo_value(value) for key, value in memo_set.items()}
+            self.memo.update(memo_set)
+            step["memo_set"] = memo_set
+        self.steps.append(step)
+
+    def to_events(self):
+        return {
+            "format": "tree-events",
+            "root": {"id": self.root["id"], "name": self.root_name},
+            "steps": self.steps,
+            "final_tree": self.root,
+            "final_memo": self.memo,
+        }
+
+    def to_frames(self):
+        return expand_tree_events(self.to_events())
+
+def _copy_tree(root):
+    copy_root = {"id": root["id"], "name": root["name"], "children": []}
+    pending = [(root, copy_root)]
+    while pending:
+        node, node_copy = pending.pop()
+        for child in node["children"]:
+            child_copy = {"id": child["id"], "name": child["name"], "children": []}
+            node_copy["children"].append(child_copy)
+            pending.append((child, child_copy))
+    return copy_root
+
+def _frame(tree, memo, step):
+    return {
+        "visualizations": [
+            {"type": "tree", "title": TREE_TITLE, "data": {"data": [tree], "activeNodeId": step["activeNodeId"]}},
+            {"type": "key-value", "title": MEMO_TITLE, "data": {"memo": memo}},
+        ],
+        "explanation": step["explanation"],
+    }
+
+class _TreeReplay:
+    def __init__(self, root):
+        self.root = {"id": root["id"], "name": root["name"], "children": []}
+        self.nodes = {self.root["id"]: self.root}
+        self.memo = {}
+
+    def apply(self, step):
+        event = step["event"]
+        if event["op"] == "add":
+            node = {"id": event["id"], "name": event["name"], "children": []}
+            self.nodes[event["id"]] = node
+            self.nodes[event["parent"]]["children"].append(node)
+        else:
+            self.nodes[event["id"]]["name"] = event["name"]
+        self.memo.update(step.get("memo_set", {}))
+
+def expand_tree_events(events_trace):
+    """Rebuilds every frame of a tree-events trace in the legacy frame format."""
+    replay = _TreeReplay(events_trace["root"])
+    frames = []
+    for step in events_trace["steps"]:
+        replay.apply(step)
+        frames.append(_frame(_copy_tree(replay.root), dict(replay.memo), step))
+    return frames
@@ -62,7 +62,13 @@ export default function ComplexityTab({ code, inputSizes }) {
     empirical_time_complexity,
     empirical_space_complexity,
     detected_functions,
+    complexity_fit,
+    complexity_source,
+    profiling_time_stats,
   } = result;
+  // The server may add larger sizes when the first ones do not settle the fit.
+  const sizes = result.input_sizes || inputSizes;
+  const timeFit = complexity_fit?.time;
 
   const recursionBadge = static_analysis.recursion_type && (
     <span className="bg-red-900/40 text-red-300 text-xs px-2 py-0.5 rounded ml-2 border border-red-700/60">
@@ -115,8 +121,16 @@ export default function ComplexityTab({ code, inputSizes }) {
         <Plot
           data={[
             {
-              x: inputSizes,
+              x: sizes,
               y: profiling_times,
+              // Medians with the interquartile range of the timing samples.
+              error_y: profiling_time_stats && {
+                type: "data",
+                symmetric: false,
+                array: profiling_time_stats.map((s) => s.q3 - s.median),
+                arrayminus: profiling_time_stats.map((s) => s.median - s.q1),
+                color: "#93c5fd",
+              },
               type: "scatter",
               mode: "lines+markers",
               name: "Execution Time (s)",
@@ -124,11 +138,11 @@ export default function ComplexityTab({ code, inputSizes }) {
               line: { color: "#3b82f6" },
             },
             {
-              x: inputSizes,
+              x: sizes,
               y: profiling_memory,
               type: "scatter",
               mode: "lines+markers",
-              name: "Memory Usage (MB)",
+              name: "Peak Allocated (MiB)",
               marker: { color: "#22c55e" },
               line: { color: "#22c55e" },
               yaxis: "y2",
@@ -142,7 +156,7 @@ export default function ComplexityTab({ code, inputSizes }) {
             xaxis: { title: "Input Size (n)", gridcolor: "#334155" },
             yaxis: { title: "Time (seconds)", gridcolor: "#334155" },
             yaxis2: {
-              title: "Memory (MB)",
+              title: "Peak Allocated (MiB)",
               overlaying: "y",
               side: "right",
             },
@@ -165,12 +179,25 @@ export default function ComplexityTab({ code, inputSizes }) {
             <p className="font-bold text-blue-400 text-lg">
               {empirical_time_complexity}
             </p>
+            {complexity_source?.time === "static" ? (
+              <p className="text-amber-400/80 text-xs mt-1">
+                From static analysis
+                {timeFit?.ambiguous && ` (timing fit inconclusive: ${Math.round(timeFit.confidence * 100)}% confidence)`}
+              </p>
+            ) : timeFit && (
+              <p className="text-gray-500 text-xs mt-1">
+                Fit confidence: {Math.round(timeFit.confidence * 100)}%
+              </p>
+            )}
           </div>
           <div className="bg-gray-900 border border-gray-700 rounded-lg p-4 text-center">
             <p className="text-gray-400 text-sm mb-1">Space Complexity</p>
             <p className="font-bold text-green-400 text-lg">
               {empirical_space_complexity}
             </p>
+            {complexity_source?.space === "static" && (
+              <p className="text-amber-400/80 text-xs mt-1">From static analysis</p>
+            )}
           </div>
         </div>
       </div>
@@ -133,8 +133,14 @@ export default function TraceLayout({
         return <ConditionVisualizer event={currentEvent} scale={scale} updateScale={updateScale} />;
 
       case "loop_iteration":
-      case "while_iteration":
-        return <LoopVisualizer event={currentEvent} scale={scale} updateScale={updateScale} />;
+      case "while_iteration": {
+        // The iterable is sent once per loop; later iterations point back to that step.
+        const snapshotStep = currentEvent.snapshot_step;
+        const loopEvent = currentEvent.iterable_snapshot || snapshotStep === undefined
+          ? currentEvent
+          : { ...currentEvent, iterable_snapshot: trace[snapshotStep]?.event?.iterable_snapshot };
+        return <LoopVisualizer event={loopEvent} scale={scale} updateScale={updateScale} />;
+      }
 
       case "return_value":
         return <ReturnVisualizer event={currentEvent} scale={scale} updateScale={updateScale} />;
@@ -1,7 +1,8 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useMemo } from "react";
 import { useParams, Link } from "react-router-dom";
 import { DP_ALGORITHMS } from "../../data/dp_algorithms";
 import { parseInputs } from "../../utils/input_parser";
+import { frameAt, traceLength, KEYFRAME_INTERVAL } from "../../utils/dpFrames";
 import ControlDeck from "./ControlDeck";
 import DPGrid from "./DPGrid";
 import DPArray from "./DPArray";
@@ -42,9 +43,10 @@ export default function DpVisualizationPage() {
   const [isPlaying, setIsPlaying] = useState(false);
   const [speed, setSpeed] = useState(500);
 
-  const activeTrace = trace[mode] || [];
-  const totalSteps = activeTrace.length;
-  const currentFrame = activeTrace[currentStep] || {};
+  const activeTrace = trace[mode];
+  const totalSteps = traceLength(activeTrace);
+  // The traces hold one event per step; only the frame on screen is rebuilt.
+  const currentFrame = useMemo(() => frameAt(activeTrace, currentStep) || {}, [activeTrace, currentStep]);
   const isAnimationComplete = currentStep === totalSteps - 1 && totalSteps > 0;
 
   const fetchVisualizations = useCallback(async (currentInputs) => {
@@ -52,7 +54,7 @@ export default function DpVisualizationPage() {
     setIsLoading(true);
     setIsPlaying(false);
     try {
-      const response = await fetch(`https://codevizai2026.onrender.com/api/visualize/${algoId}`, {
+      const response = await fetch(`https://codevizai2026.onrender.com/api/visualize/${algoId}?frames=delta&keyframe_interval=${KEYFRAME_INTERVAL}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(parsed),
@@ -107,7 +109,7 @@ export default function DpVisualizationPage() {
         onVisualize={fetchVisualizations}
         mode={mode}
         onModeChange={handleModeChange}
-        isTopDownDisabled={!trace["top-down"] || trace["top-down"].length === 0}
+        isTopDownDisabled={traceLength(trace["top-down"]) === 0}
         isPlaying={isPlaying}
         isLoading={isLoading}
         onPlay={() => setIsPlaying(true)}
@@ -128,7 +130,7 @@ export default function DpVisualizationPage() {
       {/* --- SECTION 4: Visualization Area --- */}
       <main className="flex-grow min-h-[400px]">
         {isLoading ? <Loader /> 
-        : !activeTrace || activeTrace.length === 0 ? (
+        : totalSteps === 0 ? (
             <div className="flex justify-center items-center h-full text-[#64748b]">
                 No visualization data. Click 'Visualize' to generate.
             </div>
@@ -71,6 +71,13 @@ function generateExplanation(event) {
           <code>{formatValue(event.current_value)}</code>.
         </>
       );
+    case 'loop_summary':
+      return (
+        <>
+          Skipping iterations {event.first_iteration}-{event.last_iteration} of the loop on line{' '}
+          <code>{event.loop_line}</code> ({event.steps} steps).
+        </>
+      );
     case 'condition_check':
       return (
         <>
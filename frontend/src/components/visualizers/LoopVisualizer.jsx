@@ -34,7 +34,8 @@ const LoopVisualizer = ({ event, scale, updateScale }) => {
   const {
     loop_variable_name: varName,
     current_value: rawValue,
-    iterable_snapshot: snapshot = []
+    iterable_snapshot: snapshot = [],
+    index
   } = event;
 
   const currentValue = rawValue?.value ?? rawValue;
@@ -42,9 +43,8 @@ const LoopVisualizer = ({ event, scale, updateScale }) => {
   // Extract simple values from snapshot objects if necessary
   const arraySnapshot = snapshot.map(item => (typeof item === 'object' && item !== null ? item.value : item));
 
-  // Find index (Note: indexOf finds the first occurrence. 
-  // Ideally, backend provides specific index, but this is a solid fallback)
-  const currentIndex = arraySnapshot.indexOf(currentValue);
+  // Older traces have no index; indexOf finds the first occurrence.
+  const currentIndex = index ?? arraySnapshot.indexOf(currentValue);
 
   return (
     <div
@@ -4,6 +4,9 @@ import { motion, AnimatePresence } from "framer-motion";
 
 // NEW: A recursive function to display variables of any type (primitive, list, etc.)
 const renderValue = (data) => {
+    if (data && data.type === "ref") {
+        return "[...]"; // A container reached from inside itself
+    }
     if (!data || data.value === undefined) {
         return String(data); // Fallback for simple values
     }
@@ -13,7 +16,16 @@ const renderValue = (data) => {
             return String(data.value);
         case "list":
             // Recursively render each item in the list and join them with commas
-            return `[${data.value.map(item => renderValue(item)).join(', ')}]`;
+            return `[${data.value.map(item => renderValue(item)).join(', ')}${data.truncated ? ', ...' : ''}]`;
+        case "tuple":
+            return `(${data.value.map(item => renderValue(item)).join(', ')}${data.truncated ? ', ...' : ''})`;
+        case "set":
+        case "deque":
+            return `${data.type}(${data.value.map(item => renderValue(item)).join(', ')}${data.truncated ? ', ...' : ''})`;
+        case "dict":
+            return `{${Object.entries(data.value).map(([k, v]) => `${k}: ${renderValue(v)}`).join(', ')}${data.truncated ? ', ...' : ''}}`;
+        case "ndarray":
+            return `array(${JSON.stringify(data.value)})`;
         case "object":
             return `<${data.class_name} object>`;
         default:
@@ -110,18 +110,40 @@ print("Factorial of", num, "is:", factorial(num))
 
     setIsExplaining(true);
     try {
-      const res = await fetch("https://codevizai2026.onrender.com/ai/explain_full", {
+      // Server-sent events: "token" pieces as they are generated, then "end" or "error".
+      const res = await fetch("https://codevizai2026.onrender.com/ai/explain_full/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ code: code }),
       });
 
-      if (!res.ok) throw new Error("Failed to fetch AI explanation");
-
-      const data = await res.json();
-      if (data.full_explanation) {
-        setFullExplanation(data.full_explanation);
-      } else {
+      if (!res.ok || !res.body) throw new Error("Failed to fetch AI explanation");
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let text = "";
+      let finished = false;
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const type = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "{}");
+          if (type === "token") {
+            text += data.text;
+            setFullExplanation(text);
+          } else if (type === "error") {
+            throw new Error(data.detail);
+          } else if (type === "end") {
+            finished = true;
+          }
+        }
+      }
+      if (!text) {
         setFullExplanation("⚠️ No explanation returned from API.");
       }
     } catch (e) {
@@ -611,7 +633,7 @@ print("Factorial of", num, "is:", factorial(num))
                             </div>
 
                             <div className="flex-grow overflow-y-auto pr-2 custom-scrollbar">
-                              {isExplaining ? (
+                              {isExplaining && !fullExplanation ? (
                                 <div className="flex flex-col items-center justify-center h-full text-indigo-400 animate-pulse">
                                   <p className="text-lg">
                                     🧠 Generating comprehensive analysis...
@@ -0,0 +1,114 @@
+// The DP page asks /api/visualize for frames=delta: top-down traces come back
+// as recursion tree events and bottom-up tables as single-cell updates (see
+// backend/tracers/recursion_tree.py and grid_frames.py). frameAt() rebuilds the
+// frame being shown in the same shape the full frames have; traces that are
+// already a list of frames (coin change bottom-up) are used as they are.
+
+// Bottom-up tables carry every known cell every KEYFRAME_INTERVAL steps, so
+// stepping back replays from the nearest keyframe instead of the start.
+export const KEYFRAME_INTERVAL = 50;
+
+const TREE_TITLE = "Recursion Tree";
+const MEMO_TITLE = "Memoization Table";
+
+export const traceLength = (trace) => {
+  if (!trace) return 0;
+  return Array.isArray(trace) ? trace.length : trace.steps?.length || 0;
+};
+
+// One replay per trace, so stepping forward only applies the new steps.
+const replays = new WeakMap();
+
+const copyTree = (node) => ({ id: node.id, name: node.name, children: node.children.map(copyTree) });
+
+const treeReplay = (trace) => ({
+  reset() {
+    this.root = { id: trace.root.id, name: trace.root.name, children: [] };
+    this.nodes = { [this.root.id]: this.root };
+    this.memo = {};
+    this.applied = 0;
+  },
+  rewind() {
+    this.reset();
+  },
+  apply(step) {
+    const { event } = step;
+    if (event.op === "add") {
+      const node = { id: event.id, name: event.name, children: [] };
+      this.nodes[event.id] = node;
+      this.nodes[event.parent].children.push(node);
+    } else {
+      this.nodes[event.id].name = event.name;
+    }
+    Object.assign(this.memo, step.memo_set);
+  },
+  frame(step) {
+    return {
+      explanation: step.explanation,
+      visualizations: [
+        { type: "tree", title: TREE_TITLE, data: { data: [copyTree(this.root)], activeNodeId: step.activeNodeId } },
+        { type: "key-value", title: MEMO_TITLE, data: { memo: { ...this.memo } } },
+      ],
+    };
+  },
+});
+
+const gridReplay = (trace) => ({
+  reset() {
+    this.load(trace.initial);
+    this.applied = 0;
+  },
+  load(cells) {
+    this.cells = new Map();
+    cells.forEach((cell) => this.cells.set(`${cell.i},${cell.j}`, cell));
+  },
+  rewind(index) {
+    // A keyframe holds the table after its own step.
+    let start = index;
+    while (start >= 0 && !trace.steps[start].keyframe) start -= 1;
+    if (start < 0) return this.reset();
+    this.load(trace.steps[start].keyframe);
+    this.applied = start + 1;
+  },
+  apply(step) {
+    if (step.cell) this.cells.set(`${step.cell.i},${step.cell.j}`, step.cell);
+  },
+  frame(step) {
+    return {
+      explanation: step.explanation,
+      visualizations: [
+        { type: "grid-2d", title: trace.title, data: {
+          steps: [...this.cells.values()],
+          n: trace.n, m: trace.m,
+          highlightedCell: step.highlightedCell,
+          rowLabels: trace.rowLabels,
+          colLabels: trace.colLabels,
+        } },
+        { type: "variables", title: step.variables.title, data: step.variables.data },
+      ],
+    };
+  },
+});
+
+const replayFactories = { "tree-events": treeReplay, "grid-cells": gridReplay };
+
+export const frameAt = (trace, index) => {
+  if (!trace) return undefined;
+  if (Array.isArray(trace)) return trace[index];
+  const makeReplay = replayFactories[trace.format];
+  const step = trace.steps?.[index];
+  if (!makeReplay || !step) return undefined;
+
+  let replay = replays.get(trace);
+  if (!replay) {
+    replay = makeReplay(trace);
+    replay.reset();
+    replays.set(trace, replay);
+  }
+  if (index < replay.applied - 1) replay.rewind(index);
+  while (replay.applied <= index) {
+    replay.apply(trace.steps[replay.applied]);
+    replay.applied += 1;
+  }
+  return replay.frame(step);
+};